@@ -0,0 +1,97 @@
+import fnmatch
+import re
+
+
+SIZE_UNITS = {'': 1, 'b': 1, 'k': 1024, 'kb': 1024, 'm': 1024 ** 2, 'mb': 1024 ** 2, 'g': 1024 ** 3, 'gb': 1024 ** 3}
+
+
+def parse_patterns(value):
+    if not value:
+        return ()
+    if isinstance(value, str):
+        value = value.split(',')
+    return tuple(pattern.strip().lower() for pattern in value if pattern.strip())
+
+def parse_size(value):
+    # Accepts plain bytes or a K/KB/M/MB/G/GB suffix, e.g. "5MB"
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*', str(value))
+    if not match or match.group(2).lower() not in SIZE_UNITS:
+        raise ValueError(f"Invalid size: {value!r}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+
+def estimated_size(part):
+    # Decoded size worked out from the still-encoded payload, so rejected
+    # parts never get decoded
+    payload = part.get_payload(decode=False)
+    if not isinstance(payload, str):
+        return 0
+    encoding = str(part.get('Content-Transfer-Encoding', '')).strip().lower()
+    if encoding == 'base64':
+        padding = payload.rstrip()[-2:].count('=')
+        data = len(payload) - payload.count('\n') - payload.count('\r') - payload.count(' ') - payload.count('\t')
+        return max(0, data * 3 // 4 - padding)
+    return len(payload)
+
+
+class AttachmentRules:
+    # Include/exclude rules checked against a part's headers and encoded size
+    # before its payload is decoded. MIME types and file names are
+    # case-insensitive globs ("image/*", "*.pdf"); excludes win over includes
+    # and empty include lists allow everything.
+    def __init__(
+            self,
+            include_types=(),
+            exclude_types=(),
+            include_names=(),
+            exclude_names=(),
+            min_size=None,
+            max_size=None
+    ):
+        self.include_types = parse_patterns(include_types)
+        self.exclude_types = parse_patterns(exclude_types)
+        self.include_names = parse_patterns(include_names)
+        self.exclude_names = parse_patterns(exclude_names)
+        self.min_size = parse_size(min_size)
+        self.max_size = parse_size(max_size)
+
+    @classmethod
+    def from_config(cls, config):
+        section = config['Attachments'] if 'Attachments' in config else {}
+        return cls(
+            include_types=section.get('include_types', ''),
+            exclude_types=section.get('exclude_types', ''),
+            include_names=section.get('include_names', ''),
+            exclude_names=section.get('exclude_names', ''),
+            min_size=section.get('min_size', ''),
+            max_size=section.get('max_size', '')
+        )
+
+    def is_empty(self):
+        return not (self.include_types or self.exclude_types or self.include_names
+                    or self.exclude_names or self.min_size or self.max_size)
+
+    def allows(self, content_type, filename, size=None):
+        content_type = (content_type or '').lower()
+        filename = (filename or '').lower()
+        if any(fnmatch.fnmatchcase(content_type, pattern) for pattern in self.exclude_types):
+            return False
+        if any(fnmatch.fnmatchcase(filename, pattern) for pattern in self.exclude_names):
+            return False
+        if self.include_types and not any(fnmatch.fnmatchcase(content_type, pattern) for pattern in self.include_types):
+            return False
+        if self.include_names and not any(fnmatch.fnmatchcase(filename, pattern) for pattern in self.include_names):
+            return False
+        if size is not None:
+            if self.min_size is not None and size < self.min_size:
+                return False
+            if self.max_size is not None and size > self.max_size:
+                return False
+        return True
+
+    def allows_part(self, part, filename):
+        size = estimated_size(part) if (self.min_size is not None or self.max_size is not None) else None
+        return self.allows(part.get_content_type(), filename, size)
@@ -0,0 +1,127 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+TEXT_EXTENSIONS = ('.txt', '.csv', '.tsv', '.json', '.xml', '.html', '.htm')
+PDF_EXTENSIONS = ('.pdf',)
+# Excel refuses cells longer than 32767 characters
+MAX_TEXT_CHARS = 32000
+
+
+def can_extract(path):
+    return os.path.splitext(path)[1].lower() in TEXT_EXTENSIONS + PDF_EXTENSIONS
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def extract_text(path):
+    # Runs in a worker process
+    ext = os.path.splitext(path)[1].lower()
+    if ext in PDF_EXTENSIONS:
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise RuntimeError("PDF text extraction requires pypdf (pip install pypdf)")
+        reader = PdfReader(path)
+        text = '\n'.join(page.extract_text() or '' for page in reader.pages)
+    else:
+        with open(path, 'rb') as f:
+            text = f.read().decode('utf-8', errors='replace')
+        if ext in ('.html', '.htm'):
+            from pipeline import html_to_text
+            text = html_to_text(text)
+    return ' '.join(text.split())
+
+
+class TextCache:
+    # Extracted text stored by payload hash, so duplicate receipts and reruns
+    # never parse the same file twice
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, digest):
+        return os.path.join(self.cache_dir, digest[:2], digest + '.txt')
+
+    def get(self, digest):
+        try:
+            with open(self._path(digest), encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, digest, text):
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_path, path)
+
+
+class AttachmentTextExtractor:
+    # Optional stage: adds the text of saved PDF/text attachments to each
+    # record's Attachment Text column
+    def __init__(self, cache_dir, workers=2, max_chars=MAX_TEXT_CHARS):
+        self.cache = TextCache(cache_dir)
+        self.workers = max(1, workers)
+        self.max_chars = max_chars
+        self.extracted = 0
+        self.cache_hits = 0
+
+    def extract(self, records, emit=print):
+        texts = {}
+        pending = {}
+        by_record = []
+        for record in records:
+            digests = []
+            for path in record.attachments:
+                if not can_extract(path):
+                    continue
+                try:
+                    digest = file_hash(path)
+                except OSError as e:
+                    emit(f"Error reading attachment {os.path.basename(path)}: {e}")
+                    continue
+                digests.append(digest)
+                if digest in texts or digest in pending:
+                    continue
+                cached = self.cache.get(digest)
+                if cached is not None:
+                    texts[digest] = cached
+                    self.cache_hits += 1
+                else:
+                    pending[digest] = path
+            by_record.append((record, digests))
+
+        if pending:
+            emit(f"Extracting text from {len(pending)} attachments")
+            if self.workers > 1 and len(pending) > 1:
+                with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                    futures = {digest: executor.submit(extract_text, path) for digest, path in pending.items()}
+                    results = {digest: future.exception() or future.result() for digest, future in futures.items()}
+            else:
+                results = {}
+                for digest, path in pending.items():
+                    try:
+                        results[digest] = extract_text(path)
+                    except Exception as e:
+                        results[digest] = e
+
+            for digest, result in results.items():
+                if isinstance(result, BaseException):
+                    emit(f"Error extracting text from {os.path.basename(pending[digest])}: {result}")
+                    continue
+                self.cache.put(digest, result)
+                texts[digest] = result
+                self.extracted += 1
+
+        for record, digests in by_record:
+            parts = [texts[digest] for digest in digests if texts.get(digest)]
+            record.attachment_text = '\n\n'.join(parts)[:self.max_chars]
+        return records
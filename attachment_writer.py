@@ -0,0 +1,92 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+FSYNC_MODES = ('none', 'group', 'each')
+
+
+class AttachmentWriter:
+    # Writes attachment payloads on a small thread pool so parsing never waits
+    # on disk. At most max_pending payloads are held in memory; submit() blocks
+    # beyond that, which is what keeps slow (network) disks from piling up data.
+    def __init__(self, max_workers=4, max_pending=32, fsync_mode='none', fsync_batch=16):
+        if fsync_mode not in FSYNC_MODES:
+            raise ValueError(f"fsync mode must be one of {', '.join(FSYNC_MODES)}, got {fsync_mode!r}")
+        self.fsync_mode = fsync_mode
+        self.fsync_batch = max(1, fsync_batch)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='attachment-writer')
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._sync_lock = threading.Lock()
+        self._unsynced = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def submit(self, payload, save_dir, filename):
+        # Returns a Future resolving to the final path of the written file
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._write, payload, save_dir, filename)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _write(self, payload, save_dir, filename):
+        base, ext = os.path.splitext(os.path.join(save_dir, filename))
+        filepath = base + ext
+        counter = 1
+        # O_EXCL makes the name reservation atomic across writer threads
+        while True:
+            try:
+                fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+                break
+            except FileExistsError:
+                filepath = f"{base}_{counter}{ext}"
+                counter += 1
+
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            if self.fsync_mode == 'each':
+                f.flush()
+                os.fsync(f.fileno())
+
+        if self.fsync_mode == 'group':
+            batch = None
+            with self._sync_lock:
+                self._unsynced.append(filepath)
+                if len(self._unsynced) >= self.fsync_batch:
+                    batch, self._unsynced = self._unsynced, []
+            if batch:
+                sync_files(batch)
+        return filepath
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._sync_lock:
+            batch, self._unsynced = self._unsynced, []
+        if batch:
+            sync_files(batch)
+
+
+def sync_files(paths):
+    for path in paths:
+        fd = os.open(path, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    # New directory entries are only durable once the directory is synced too
+    if hasattr(os, 'O_DIRECTORY'):
+        for directory in {os.path.dirname(path) for path in paths}:
+            fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
@@ -0,0 +1,394 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Modules the CLI path must not pay for at startup
+HEAVY_MODULES = ('pandas', 'bs4', 'tkinter', 'dateutil', 'pyarrow')
+
+STARTUP_SNIPPET = '''
+import sys, time
+started = time.perf_counter()
+import email_processor
+elapsed = time.perf_counter() - started
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(elapsed, ','.join(heavy) or '-')
+'''
+
+
+def bench_startup(args):
+    snippet = STARTUP_SNIPPET.format(heavy=HEAVY_MODULES)
+    import_times = []
+    process_times = []
+    heavy_loaded = set()
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-c', snippet],
+            cwd=BASE_DIR,
+            capture_output=True,
+            text=True
+        )
+        process_times.append(time.perf_counter() - started)
+        if result.returncode != 0:
+            print(f"Importing email_processor failed:\n{result.stderr}")
+            return 1
+        import_time, heavy = result.stdout.split()
+        import_times.append(float(import_time))
+        if heavy != '-':
+            heavy_loaded.update(heavy.split(','))
+
+    import_ms = statistics.median(import_times) * 1000
+    process_ms = statistics.median(process_times) * 1000
+    print(f"Startup over {args.runs} runs: import email_processor {import_ms:.1f} ms, "
+          f"interpreter + import {process_ms:.1f} ms (median)")
+
+    failed = False
+    if heavy_loaded:
+        print(f"REGRESSION: CLI import pulled in {', '.join(sorted(heavy_loaded))}")
+        failed = True
+    if import_ms > args.budget_ms:
+        print(f"REGRESSION: import took {import_ms:.1f} ms, budget is {args.budget_ms} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+def synthetic_fields(i):
+    # Strings are built per message, as the parser would, so repeated senders
+    # and folders start out as separate objects
+    month = ('January', 'February', 'March')[i % 3]
+    return (
+        f"Bukti Pembayaran Transaksi PT. KAI Persero #{i}",
+        f"PT. KAI <noreply{i % 5}@kai.id>",
+        f"Sun, 05 Jan 2025 10:{i % 60:02d}:00 +0700",
+        f"Receipt {i} amount Rp {i * 1000} " + "x" * 400,
+        [f"/data/email_attachments/{month} 2025/receipt_{i}.pdf"],
+        f"msg{i}@kai.id",
+        f"{i:064x}",
+        f"{month} 2025"
+    )
+
+def measure(build, count):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    records = build(count)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return records, size
+
+def bench_memory(args):
+    from records import EmailRecord, records_to_columns
+
+    def build_dicts(count):
+        rows = []
+        for i in range(count):
+            subject, sender, date, content, attachments, message_id, digest, folder = synthetic_fields(i)
+            rows.append({
+                'Subject': subject,
+                'Sender': sender,
+                'Date': date,
+                'Content': content,
+                'Attachments': '; '.join(attachments),
+                'Message-ID': message_id,
+                'Content-Hash': digest,
+                'Folder': folder
+            })
+        return rows
+
+    def build_records(count):
+        return [EmailRecord(*synthetic_fields(i)) for i in range(count)]
+
+    results = {}
+    for name, build in (('dict rows', build_dicts), ('EmailRecord', build_records)):
+        records, size = measure(build, args.count)
+        results[name] = size
+        print(f"{name:12s}: {size / 1024 / 1024:8.1f} MB for {args.count} messages, "
+              f"{size / args.count * 100000 / 1024 / 1024:8.1f} MB per 100k")
+        del records
+
+    records = build_records(args.count)
+    started = time.perf_counter()
+    batch = records_to_columns(records)
+    elapsed = time.perf_counter() - started
+    shared = all(value is record.content for value, record in zip(batch['Content'], records))
+    print(f"records_to_columns: {elapsed * 1000:.1f} ms, content shared without copy: {shared}")
+    saved = 1 - results['EmailRecord'] / results['dict rows']
+    print(f"EmailRecord saves {saved:.0%} over dict rows")
+    return 0
+
+
+def synthetic_message(i):
+    from email.message import EmailMessage
+    message = EmailMessage()
+    message['Subject'] = f"=?utf-8?b?QnVrdGkgUGVtYmF5YXJhbg==?= Transaksi PT. KAI Persero #{i}"
+    message['From'] = f"PT. KAI <noreply{i % 5}@kai.id>"
+    message['Date'] = f"Sun, 05 Jan 2025 10:{i % 60:02d}:00 +0700"
+    message['Message-ID'] = f"<msg{i}@kai.id>"
+    rows = ''.join(f"<tr><td>Item {n}</td><td>Rp {n * 1000}</td></tr>" for n in range(40))
+    message.set_content(f"Receipt {i}\n" + "Detail line\n" * 40)
+    message.add_alternative(f"<html><style>td {{}}</style><body><table>{rows}</table></body></html>", subtype='html')
+    message.add_attachment(b"%PDF-1.4 " + bytes(range(256)) * 64, maintype='application', subtype='pdf',
+                           filename=f"receipt_{i}.pdf")
+    return message.as_bytes()
+
+def bench_parse(args):
+    from parse_pool import ParsePool
+
+    raw_emails = [synthetic_message(i) for i in range(args.count)]
+    total_mb = sum(len(raw) for raw in raw_emails) / 1024 / 1024
+    baseline = None
+    for workers in (int(value) for value in args.workers.split(',')):
+        with ParsePool(workers=workers, chunk_size=args.chunk_size) as pool:
+            pool.parse(raw_emails[:min(len(raw_emails), workers * 2)])  # start the workers
+            started = time.perf_counter()
+            for start in range(0, len(raw_emails), pool.chunk_size):
+                results = pool.parse(raw_emails[start:start + pool.chunk_size])
+                errors = [result for result in results if isinstance(result, Exception)]
+                if errors:
+                    print(f"Parse error: {errors[0]}")
+                    return 1
+            elapsed = time.perf_counter() - started
+        rate = args.count / elapsed
+        baseline = baseline or rate
+        print(f"{workers:2d} workers: {rate:8.0f} msgs/s, {total_mb / elapsed:6.1f} MB/s, {rate / baseline:4.1f}x")
+    return 0
+
+
+def legacy_clean_subject(subject):
+    # clean_subject as it was before charsets.decode_header_value
+    from email.header import decode_header
+    decoded_subject = []
+    for part, encoding in decode_header(subject):
+        if isinstance(part, bytes):
+            part = part.decode(encoding or 'utf-8', errors='ignore')
+        decoded_subject.append(part)
+    return ' '.join(decoded_subject)
+
+def synthetic_headers(count):
+    samples = (
+        "Bukti Pembayaran Transaksi PT. KAI Persero #{i}",
+        "=?utf-8?b?QnVrdGkgUGVtYmF5YXJhbg==?= Transaksi PT. KAI Persero #{i}",
+        "=?UTF-8?Q?Pembayaran_tiket_kereta_=E2=80=93_?= =?UTF-8?Q?Jakarta_#{i}?=",
+        "=?iso-8859-1?q?Re=3A_Facture_pay=E9e?= #{i}",
+        "=?utf-8?b?56Gu6KqN44Oh44O844Or?=\r\n =?utf-8?b?IOODgeOCseODg+ODiA==?= #{i}"
+    )
+    # Every fifth subject repeats, like the same notification sent again
+    return [samples[i % len(samples)].format(i=i if i % 5 else 0) for i in range(count)]
+
+def bench_headers(args):
+    from charsets import decode_encoded_words, decode_header_value
+
+    headers = synthetic_headers(args.count)
+    results = {}
+    for name, decode in (('decode_header + join', legacy_clean_subject), ('decode_header_value', decode_header_value)):
+        best = None
+        for _ in range(args.runs):
+            decode_encoded_words.cache_clear()
+            started = time.perf_counter()
+            for header in headers:
+                decode(header)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = best
+        print(f"{name:22s} {best / len(headers) * 1e6:6.2f} us/header")
+    print(f"Speedup: {results['decode_header + join'] / results['decode_header_value']:.1f}x")
+    return 0
+
+def bench_archive(args):
+    import random
+    import shutil
+    import tempfile
+    from raw_archive import RawArchiveReader, RawArchiveSink, load_zstandard
+    from records import EmailRecord
+
+    raw_emails = [synthetic_message(i) for i in range(args.count)]
+    raw_mb = sum(len(raw) for raw in raw_emails) / 1024 / 1024
+    codecs = ['gzip'] + (['zstd'] if load_zstandard() is not None else [])
+    for codec in codecs:
+        base_dir = tempfile.mkdtemp()
+        try:
+            sink = RawArchiveSink(base_dir, compression=codec, segment_size=args.segment_size)
+            started = time.perf_counter()
+            for i, raw in enumerate(raw_emails):
+                sink.add(raw, EmailRecord(date="Sun, 05 Jan 2025 10:00:00 +0700", content_hash=str(i),
+                                          message_id=f"<msg{i}@kai.id>"))
+            sink.close()
+            write_seconds = time.perf_counter() - started
+
+            month_dir = os.path.join(base_dir, os.listdir(base_dir)[0])
+            keys = random.Random(0).choices(range(args.count), k=args.reads)
+            started = time.perf_counter()
+            for key in keys:
+                # A fresh reader per lookup, so no segment is reused
+                RawArchiveReader(month_dir).get(str(key))
+            read_ms = (time.perf_counter() - started) / len(keys) * 1000
+        finally:
+            shutil.rmtree(base_dir)
+        print(f"{codec:5s} {raw_mb:.1f} MB -> {sink.stored_bytes / 1024 / 1024:.1f} MB "
+              f"({sink.stored_bytes / sink.raw_bytes:.0%}), write {raw_mb / write_seconds:.1f} MB/s, "
+              f"random read {read_ms:.2f} ms/message")
+    if 'zstd' not in codecs:
+        print("zstandard is not installed, zstd skipped")
+    return 0
+
+class StubRoot:
+    # Stands in for tk.Tk so the Log tab path runs without a display
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, delay_ms, callback):
+        self.scheduled.append(callback)
+
+    def update_idletasks(self):
+        pass
+
+    def update(self):
+        # What the event loop would do once processing returns
+        callbacks, self.scheduled = self.scheduled, []
+        for callback in callbacks:
+            callback()
+
+
+class StubText:
+    # Line-based stand-in for tk.Text, supporting the calls refresh_log makes
+    def __init__(self):
+        self.lines = []
+
+    def line_number(self, index):
+        if index == 'end':
+            return len(self.lines) + 1
+        return int(index.split('.')[0])
+
+    def insert(self, index, text):
+        self.lines.extend(text.split('\n')[:-1])
+
+    def delete(self, first, last):
+        del self.lines[self.line_number(first) - 1:self.line_number(last) - 1]
+
+    def see(self, index):
+        pass
+
+
+class StubVar:
+    def set(self, value):
+        self.value = value
+
+
+def create_gui_app(use_tk, log_path):
+    # (app, root). Headless by default: a real EmailProcessorApp whose root,
+    # Log text and status variable are stubs, so update_status, refresh_log
+    # and clear_log run unchanged
+    import configparser
+    from email_processor_gui import EmailProcessorApp
+    if use_tk:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+        return EmailProcessorApp(root, log_path=log_path), root
+    app = EmailProcessorApp.__new__(EmailProcessorApp)
+    app.root = StubRoot()
+    app.config = configparser.ConfigParser()
+    app.log_text = StubText()
+    app.status_var = StubVar()
+    app.init_log_view(log_path)
+    return app, app.root
+
+def bench_gui(args):
+    import shutil
+    import tempfile
+    log_dir = tempfile.mkdtemp()
+    try:
+        app, root = create_gui_app(args.tk, os.path.join(log_dir, 'status.log'))
+    except Exception as e:
+        # A skipped run must not look like a passing one
+        print(f"GUI benchmark could not start: {e}")
+        shutil.rmtree(log_dir)
+        return 1
+    try:
+        latencies = []
+        started = time.perf_counter()
+        for i in range(args.events):
+            event_started = time.perf_counter()
+            app.update_status(f"Processing email {i + 1}/{args.events}")
+            latencies.append(time.perf_counter() - event_started)
+        root.update()
+        app.refresh_log()
+        elapsed = time.perf_counter() - started
+        visible = app.rendered_lines
+
+        clear_started = time.perf_counter()
+        app.clear_log()
+        root.update()
+        clear_ms = (time.perf_counter() - clear_started) * 1000
+
+        latencies.sort()
+        app.status_log.flush()
+        log_lines = sum(1 for name in os.listdir(log_dir) for _ in open(os.path.join(log_dir, name), encoding='utf-8'))
+        p99_ms = latencies[int(len(latencies) * 0.99)] * 1000
+        print(f"{args.events} status events in {elapsed:.2f} s ({args.events / elapsed:.0f} events/s), "
+              f"{'Tk' if args.tk else 'headless stub widgets'}")
+        print(f"update_status latency: median {statistics.median(latencies) * 1e6:.1f} us, "
+              f"p99 {p99_ms:.2f} ms, max {latencies[-1] * 1000:.2f} ms")
+        print(f"Log tab holds {visible} lines, clear_log: {clear_ms:.2f} ms, log files hold {log_lines} lines")
+    finally:
+        app.on_close() if args.tk else app.status_log.close()
+        shutil.rmtree(log_dir)
+
+    failed = False
+    if visible > app.status_log.max_lines:
+        print(f"REGRESSION: Log tab holds {visible} lines, limit is {app.status_log.max_lines}")
+        failed = True
+    if p99_ms > args.budget_ms:
+        print(f"REGRESSION: update_status p99 {p99_ms:.2f} ms, budget is {args.budget_ms} ms")
+        failed = True
+    return 1 if failed else 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks for the email attachment processor')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    startup = subparsers.add_parser('startup', help='cold-start cost of the CLI entry point')
+    startup.add_argument('--runs', type=int, default=10)
+    startup.add_argument('--budget-ms', type=float, default=250.0)
+    startup.set_defaults(func=bench_startup)
+
+    memory = subparsers.add_parser('memory', help='memory held by processed email records')
+    memory.add_argument('--count', type=int, default=100000)
+    memory.set_defaults(func=bench_memory)
+
+    parse = subparsers.add_parser('parse', help='MIME parse throughput by worker count')
+    parse.add_argument('--count', type=int, default=2000)
+    parse.add_argument('--workers', default=f"1,2,{os.cpu_count() or 1}")
+    parse.add_argument('--chunk-size', type=int, default=None)
+    parse.set_defaults(func=bench_parse)
+
+    headers = subparsers.add_parser('headers', help='RFC 2047 subject decoding cost')
+    headers.add_argument('--count', type=int, default=20000)
+    headers.add_argument('--runs', type=int, default=5)
+    headers.set_defaults(func=bench_headers)
+
+    archive = subparsers.add_parser('archive', help='raw email archive size, write speed and random reads')
+    archive.add_argument('--count', type=int, default=2000)
+    archive.add_argument('--reads', type=int, default=200)
+    archive.add_argument('--segment-size', type=int, default=1024 * 1024)
+    archive.set_defaults(func=bench_archive)
+
+    gui = subparsers.add_parser('gui', help='Log tab update cost for a stream of status events')
+    gui.add_argument('--events', type=int, default=100000)
+    gui.add_argument('--budget-ms', type=float, default=5.0, help='p99 update_status latency budget')
+    gui.add_argument('--tk', action='store_true', help='use a real, withdrawn Tk window (needs a display)')
+    gui.set_defaults(func=bench_gui)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == '__main__':
+    main()
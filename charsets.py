@@ -0,0 +1,143 @@
+import binascii
+import codecs
+import functools
+import re
+from email.header import decode_header
+
+
+# Labels seen in the wild that Python doesn't know, or that mail clients use
+# for a superset. None means "undeclared": try UTF-8, then Windows-1252.
+CHARSET_ALIASES = {
+    'unknown': None,
+    'unknown-8bit': None,
+    'x-unknown': None,
+    'default': None,
+    'us-ascii': 'utf-8',
+    'ascii': 'utf-8',
+    'iso-8859-1': 'cp1252',
+    'latin1': 'cp1252',
+    'x-user-defined': 'cp1252',
+    'gb2312': 'gb18030',
+    'gbk': 'gb18030',
+    'x-gbk': 'gb18030',
+    'ks_c_5601-1987': 'cp949',
+    'euc-kr': 'cp949',
+    'shift_jis': 'cp932',
+    'x-sjis': 'cp932',
+    'tis-620': 'cp874',
+    'windows-874': 'cp874',
+    'x-mac-roman': 'mac_roman'
+}
+
+ASCII_CODECS = frozenset(['utf-8', 'ascii', 'mac-roman', 'koi8-r', 'koi8-u', 'gb18030', 'big5', 'cp874', 'cp949'])
+
+ENCODED_WORD = re.compile(r'=\?([^?\s]+)\?([QqBb])\?([^?\s]*)\?=')
+FOLD = re.compile(r'\r?\n(?=[ \t])')
+
+
+@functools.lru_cache(maxsize=256)
+def lookup_codec(charset):
+    # Charset label -> Python codec name, or None when it can't be resolved
+    if not charset:
+        return None
+    label = charset.strip().strip('"\'').lower()
+    # RFC 2231 language suffix, e.g. "utf-8*id"
+    label = label.split('*', 1)[0]
+    if label in CHARSET_ALIASES:
+        return CHARSET_ALIASES[label]
+    for candidate in (label, label[2:] if label.startswith('x-') else None):
+        if not candidate:
+            continue
+        try:
+            return codecs.lookup(candidate).name
+        except LookupError:
+            pass
+    return None
+
+def ascii_compatible(codec):
+    # Codecs that map every 7-bit byte to the same ASCII character; ISO-2022,
+    # UTF-7 and UTF-16 text is pure 7-bit (or NUL-padded) but isn't ASCII
+    return codec is None or codec in ASCII_CODECS or codec.startswith(('iso8859-', 'cp125'))
+
+def decode_bytes(data, charset=None):
+    # Never drops text: pure ASCII in an ASCII-compatible charset skips the
+    # codec machinery, undeclared or unknown charsets try UTF-8 then
+    # Windows-1252, bad bytes become U+FFFD
+    if not data:
+        return ''
+    codec = lookup_codec(charset)
+    if data.isascii() and ascii_compatible(codec):
+        return data.decode('ascii')
+    if codec is None or codec == 'utf-8':
+        try:
+            return data.decode('utf-8')
+        except UnicodeDecodeError:
+            if codec == 'utf-8':
+                return data.decode('utf-8', errors='replace')
+            codec = 'cp1252'
+    return data.decode(codec, errors='replace')
+
+def decode_word(encoding, text):
+    if encoding in 'Qq':
+        return binascii.a2b_qp(text.encode('utf-8'), header=True)
+    return binascii.a2b_base64(text + '=' * (-len(text) % 4))
+
+def decode_header_value(value):
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        # compat32 hands back a Header object for raw 8-bit headers
+        return ''.join(
+            decode_bytes(part, charset) if isinstance(part, bytes) else part
+            for part, charset in decode_header(value)
+        )
+    if '\n' in value:
+        value = FOLD.sub('', value)
+    if '=?' not in value:
+        return value
+    return decode_encoded_words(value)
+
+@functools.lru_cache(maxsize=4096)
+def decode_encoded_words(value):
+    # RFC 2047: whitespace between adjacent encoded-words is dropped and
+    # consecutive words in one charset are decoded together, so a multi-byte
+    # character split across two words survives
+    pieces = []
+    pending = bytearray()
+    pending_charset = None
+    position = 0
+    after_word = False
+    for match in ENCODED_WORD.finditer(value):
+        gap = value[position:match.start()]
+        position = match.end()
+        charset, encoding, text = match.groups()
+        try:
+            data = decode_word(encoding, text)
+        except (binascii.Error, ValueError):
+            data = None
+
+        if gap and not (after_word and gap.isspace() and data is not None):
+            if pending:
+                pieces.append(decode_bytes(bytes(pending), pending_charset))
+                pending.clear()
+            pieces.append(gap)
+        if data is None:
+            # Malformed word, keep it as written
+            if pending:
+                pieces.append(decode_bytes(bytes(pending), pending_charset))
+                pending.clear()
+            pieces.append(match.group(0))
+            after_word = False
+            continue
+
+        if pending and lookup_codec(charset) != lookup_codec(pending_charset):
+            pieces.append(decode_bytes(bytes(pending), pending_charset))
+            pending.clear()
+        pending_charset = charset
+        pending += data
+        after_word = True
+
+    if pending:
+        pieces.append(decode_bytes(bytes(pending), pending_charset))
+    pieces.append(value[position:])
+    return ''.join(pieces)
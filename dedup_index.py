@@ -0,0 +1,178 @@
+import hashlib
+import os
+import threading
+from email.parser import BytesHeaderParser
+from fetch_controller import AdaptiveFetchController, fetch_messages
+from report_writers import read_report
+
+
+def hash_key(kind, value):
+    if isinstance(value, str):
+        value = value.encode('utf-8', errors='replace')
+    return hashlib.blake2b(kind.encode() + b':' + value, digest_size=16).hexdigest()
+
+def normalize_message_id(message_id):
+    if not message_id:
+        return ''
+    return str(message_id).strip().strip('<>').strip()
+
+def message_id_key(message_id):
+    message_id = normalize_message_id(message_id)
+    return hash_key('mid', message_id) if message_id else None
+
+def content_hash(raw_email):
+    # Hash the body only: the same message delivered twice differs in its
+    # Received/Delivered-To headers but not in its content
+    separator = raw_email.find(b'\r\n\r\n')
+    if separator == -1:
+        separator = raw_email.find(b'\n\n')
+    body = raw_email[separator:] if separator != -1 else raw_email
+    return hashlib.sha256(body).hexdigest()
+
+def content_key(digest):
+    return hash_key('sha', digest)
+
+def row_key(subject, sender, date):
+    # Reports written before the index existed were deduplicated on
+    # Subject/Sender/Date and have no Message-ID column to go by
+    fields = ['' if value is None else str(value).strip() for value in (subject, sender, date)]
+    if not any(fields):
+        return None
+    return hash_key('row', '\x1f'.join(fields))
+
+def parse_message_id(header_bytes):
+    if not header_bytes:
+        return ''
+    return normalize_message_id(BytesHeaderParser().parsebytes(header_bytes).get('Message-ID', ''))
+
+
+def email_keys(message_id, digest):
+    # An email is known by its Message-ID; the body hash only stands in when
+    # there is none, so distinct receipts with identical bodies stay apart
+    key = message_id_key(message_id)
+    if key:
+        return [key]
+    return [content_key(digest)] if digest else []
+
+
+class SeenIndex:
+    # Persistent set of hashed Message-IDs, and content hashes of emails
+    # without one. The file is an append-only list of hex digests, loaded into
+    # a set once per run. Rows of a pre-index report that only have
+    # Subject/Sender/Date live in <path>.rows until an email claims them.
+    def __init__(self, path):
+        self.path = path
+        self.rows_path = path + '.rows'
+        self._seen = set()
+        self._rows = set()
+        # A missing file means a fresh install or an upgrade from a version
+        # that deduplicated inside the report
+        self.is_new = not os.path.exists(path)
+        if not self.is_new:
+            with open(path, encoding='ascii', errors='ignore') as f:
+                self._seen.update(line.strip() for line in f if line.strip())
+        if os.path.exists(self.rows_path):
+            with open(self.rows_path, encoding='ascii', errors='ignore') as f:
+                self._rows.update(line.strip() for line in f if line.strip())
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._seen
+
+    def __len__(self):
+        return len(self._seen)
+
+    def commit(self, keys):
+        new_keys = [key for key in dict.fromkeys(keys) if key and key not in self._seen]
+        if not new_keys:
+            return 0
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a', encoding='ascii') as f:
+            f.write(''.join(key + "\n" for key in new_keys))
+        self._seen.update(new_keys)
+        return len(new_keys)
+
+    def commit_records(self, records):
+        keys = []
+        for record in records:
+            keys.extend(email_keys(record.get('Message-ID'), record.get('Content-Hash')))
+        return self.commit(keys)
+
+    def has_legacy_rows(self):
+        return bool(self._rows)
+
+    def has_legacy_row(self, subject, sender, date):
+        return bool(self._rows) and row_key(subject, sender, date) in self._rows
+
+    def claim_legacy_row(self, subject, sender, date, keys):
+        # A seeded row stands for exactly one email (the old report dropped
+        # Subject/Sender/Date duplicates), so the first match takes it and is
+        # remembered by its own keys from then on
+        if not self._rows:
+            return False
+        key = row_key(subject, sender, date)
+        with self.lock:
+            if key not in self._rows:
+                return False
+            self._rows.discard(key)
+            self.commit(keys)
+            self.write_rows()
+        return True
+
+    def write_rows(self):
+        if not self._rows:
+            if os.path.exists(self.rows_path):
+                os.remove(self.rows_path)
+            return
+        temp_path = self.rows_path + '.tmp'
+        with open(temp_path, 'w', encoding='ascii') as f:
+            f.write(''.join(key + "\n" for key in self._rows))
+        os.replace(temp_path, self.rows_path)
+
+    def seed_from_report(self, output_file, report_format='xlsx'):
+        # Only a new index is seeded; afterwards the report and the index are
+        # committed together. Returns the number of rows remembered.
+        if not self.is_new:
+            return 0
+        self.is_new = False
+        keys = []
+        rows = set()
+        for row in read_report(output_file, report_format):
+            keys_for_row = email_keys(row.get('Message-ID'), row.get('Content-Hash'))
+            if keys_for_row:
+                keys.extend(keys_for_row)
+            else:
+                rows.add(row_key(row.get('Subject'), row.get('Sender'), row.get('Date')))
+        rows.discard(None)
+        # Rows first, then the index file, whose existence marks the seed done
+        self._rows.update(rows)
+        self.write_rows()
+        self.commit(keys)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        open(self.path, 'a', encoding='ascii').close()
+        return len(keys) + len(rows)
+
+
+def skip_seen_messages(mail, nums, seen_index):
+    # Peeks at the Message-ID headers only (no body, no \Seen flag) and drops
+    # messages already in the index or repeated within this search. Returns
+    # the remaining nums, their Message-IDs and the number skipped.
+    controller = AdaptiveFetchController(initial_batch=100, max_batch=1000)
+    query = '(BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)])'
+    new_nums = []
+    message_ids = {}
+    batch_keys = set()
+    for num, header_bytes in fetch_messages(mail, nums, controller, query=query):
+        message_id = parse_message_id(header_bytes)
+        key = message_id_key(message_id)
+        if key and (key in seen_index or key in batch_keys):
+            continue
+        if key:
+            batch_keys.add(key)
+        new_nums.append(num)
+        message_ids[num] = message_id
+    return new_nums, message_ids, len(nums) - len(new_nums)
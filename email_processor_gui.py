@@ -0,0 +1,411 @@
+import os
+import datetime
+import imaplib
+import time
+import tkinter as tk
+from tkinter import ttk, messagebox
+from report_writers import REPORT_WRITERS
+from attachment_filters import parse_size
+from status_log import StatusLog
+from pipeline import create_attachments_dir
+from email_processor import (
+    connect_mailbox,
+    get_base_dir,
+    get_shard_workers,
+    load_config,
+    plan_mailbox,
+    process_mailbox,
+    process_sharded,
+    save_config
+)
+
+
+# Seconds between Log tab redraws while messages keep arriving
+REFRESH_INTERVAL = 0.1
+
+
+class EmailProcessorApp:
+    def __init__(self, root, log_path=None):
+        self.root = root
+        self.root.title = 'Email Attachment Processor'
+        self.root.geometry("700x600")
+        self.config, self.config_path = load_config()
+        self.init_log_view(log_path)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # Create tabs
+        self.tab_control = ttk.Notebook(root)
+        self.setup_tab = ttk.Frame(self.tab_control)
+        self.process_tab = ttk.Frame(self.tab_control)
+        self.log_tab = ttk.Frame(self.tab_control)
+        
+        self.tab_control.add(self.setup_tab, text='Setup')
+        self.tab_control.add(self.process_tab, text='Process Emails')
+        self.tab_control.add(self.log_tab, text='Log')
+        
+        self.tab_control.pack(expand=1, fill="both")
+        
+        # Setup tab
+        self.create_setup_tab()
+        
+        # Process tab
+        self.create_process_tab()
+        
+        # Log tab
+        self.create_log_tab()
+        
+        # Load config values
+        self.load_config_values()
+
+    def create_setup_tab(self):
+        # Email credentials frame
+        cred_frame = ttk.LabelFrame(self.setup_tab, text="Email Credentials")
+        cred_frame.pack(fill="x", padx=10, pady=10)
+        
+        ttk.Label(cred_frame, text="Email:").grid(column=0, row=0, sticky=tk.W, padx=5, pady=5)
+        self.email_var = tk.StringVar()
+        ttk.Entry(cred_frame, textvariable=self.email_var, width=40).grid(column=1, row=0, padx=5, pady=5)
+        
+        ttk.Label(cred_frame, text="Password:").grid(column=0, row=1, sticky=tk.W, padx=5, pady=5)
+        self.password_var = tk.StringVar()
+        ttk.Entry(cred_frame, textvariable=self.password_var, show="*", width=40).grid(column=1, row=1, padx=5, pady=5)
+        
+        # Search criteria frame
+        search_frame = ttk.LabelFrame(self.setup_tab, text="Search Criteria")
+        search_frame.pack(fill="x", padx=10, pady=10)
+        
+        ttk.Label(search_frame, text="Subject Keyword:").grid(column=0, row=0, sticky=tk.W, padx=5, pady=5)
+        self.subject_var = tk.StringVar()
+        ttk.Entry(search_frame, textvariable=self.subject_var, width=40).grid(column=1, row=0, padx=5, pady=5)
+        
+        self.unread_var = tk.BooleanVar()
+        ttk.Checkbutton(search_frame, text="Unread Only", variable=self.unread_var).grid(column=0, row=1, columnspan=2, sticky=tk.W, padx=5, pady=5)
+        
+        # Output settings frame
+        output_frame = ttk.LabelFrame(self.setup_tab, text="Output Settings")
+        output_frame.pack(fill="x", padx=10, pady=10)
+        
+        ttk.Label(output_frame, text="Report File:").grid(column=0, row=0, sticky=tk.W, padx=5, pady=5)
+        self.excel_var = tk.StringVar()
+        ttk.Entry(output_frame, textvariable=self.excel_var, width=40).grid(column=1, row=0, padx=5, pady=5)
+        
+        ttk.Label(output_frame, text="Report Format:").grid(column=0, row=1, sticky=tk.W, padx=5, pady=5)
+        self.format_var = tk.StringVar()
+        ttk.Combobox(output_frame, textvariable=self.format_var, values=list(REPORT_WRITERS), state='readonly', width=10).grid(column=1, row=1, sticky=tk.W, padx=5, pady=5)
+        
+        ttk.Label(output_frame, text="Attachments Directory:").grid(column=0, row=2, sticky=tk.W, padx=5, pady=5)
+        self.dir_var = tk.StringVar()
+        ttk.Entry(output_frame, textvariable=self.dir_var, width=40).grid(column=1, row=2, padx=5, pady=5)
+        
+        # Save button
+        ttk.Button(self.setup_tab, text="Save Configuration", command=self.save_config_values).pack(pady=10)
+
+    def create_process_tab(self):
+        # Date range frame
+        date_frame = ttk.LabelFrame(self.process_tab, text="Date Range")
+        date_frame.pack(fill="x", padx=10, pady=10)
+        
+        ttk.Label(date_frame, text="Start Date (YYYY-MM-DD):").grid(column=0, row=0, sticky=tk.W, padx=5, pady=5)
+        self.start_date_var = tk.StringVar()
+        ttk.Entry(date_frame, textvariable=self.start_date_var, width=15).grid(column=1, row=0, padx=5, pady=5)
+        
+        ttk.Label(date_frame, text="End Date (YYYY-MM-DD):").grid(column=2, row=0, sticky=tk.W, padx=5, pady=5)
+        self.end_date_var = tk.StringVar()
+        ttk.Entry(date_frame, textvariable=self.end_date_var, width=15).grid(column=3, row=0, padx=5, pady=5)
+        
+        # Today button
+        def set_today():
+            today = datetime.datetime.now().strftime("%Y-%m-%d")
+            self.end_date_var.set(today)
+        
+        ttk.Button(date_frame, text="Set Today", command=set_today).grid(column=4, row=0, padx=5, pady=5)
+        
+        # Process and plan buttons
+        button_frame = ttk.Frame(self.process_tab)
+        button_frame.pack(pady=10)
+        ttk.Button(button_frame, text="Plan", command=self.plan_emails).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Process Emails", command=self.process_emails).pack(side=tk.LEFT, padx=5)
+        
+        # Progress frame
+        progress_frame = ttk.LabelFrame(self.process_tab, text="Progress")
+        progress_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        
+        self.progress_var = tk.DoubleVar()
+        self.progress_bar = ttk.Progressbar(progress_frame, variable=self.progress_var, maximum=100)
+        self.progress_bar.pack(fill="x", padx=5, pady=5)
+        
+        self.status_var = tk.StringVar()
+        self.status_var.set("Ready")
+        ttk.Label(progress_frame, textvariable=self.status_var).pack(padx=5, pady=5)
+    
+    def create_log_tab(self):
+        log_frame = ttk.Frame(self.log_tab)
+        log_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        
+        self.log_text = tk.Text(log_frame, wrap=tk.WORD, height=25)
+        self.log_text.pack(side=tk.LEFT, fill="both", expand=True)
+        
+        scrollbar = ttk.Scrollbar(log_frame, command=self.log_text.yview)
+        scrollbar.pack(side=tk.RIGHT, fill="y")
+        self.log_text.config(yscrollcommand=scrollbar.set)
+        
+        ttk.Button(self.log_tab, text="Clear Log", command=self.clear_log).pack(pady=5)
+    
+    def load_config_values(self):
+        if 'Credentials' in self.config:
+            self.email_var.set(self.config['Credentials'].get('email', ''))
+            self.password_var.set(self.config['Credentials'].get('password', ''))
+        
+        if 'Search' in self.config:
+            self.subject_var.set(self.config['Search'].get('subject_keyword', ''))
+            self.unread_var.set(self.config['Search'].getboolean('unread_only', True))
+        
+        if 'Output' in self.config:
+            self.excel_var.set(self.config['Output'].get('excel_file', 'email_attachment_report.xlsx'))
+            self.format_var.set(self.config['Output'].get('report_format', 'xlsx'))
+            self.dir_var.set(self.config['Output'].get('attachments_dir', ''))
+    
+    def save_config_values(self):
+        if 'Credentials' not in self.config:
+            self.config['Credentials'] = {}
+        self.config['Credentials']['email'] = self.email_var.get()
+        self.config['Credentials']['password'] = self.password_var.get()
+        
+        if 'Search' not in self.config:
+            self.config['Search'] = {}
+        self.config['Search']['subject_keyword'] = self.subject_var.get()
+        self.config['Search']['unread_only'] = str(self.unread_var.get())
+        
+        if 'Output' not in self.config:
+            self.config['Output'] = {}
+        self.config['Output']['excel_file'] = self.excel_var.get()
+        self.config['Output']['report_format'] = self.format_var.get() or 'xlsx'
+        self.config['Output']['attachments_dir'] = self.dir_var.get()
+        
+        save_config(self.config, self.config_path)
+        messagebox.showinfo("Configuration", "Configuration saved successfully!")
+    
+    def init_log_view(self, log_path=None):
+        # State behind update_status/refresh_log; needs only self.config
+        self.status_log = self.create_status_log(log_path)
+        self.latest_status = "Ready"
+        self.rendered_total = 0
+        self.rendered_cleared = 0
+        self.rendered_lines = 0
+        self.last_refresh = 0.0
+        self.refresh_pending = False
+
+    def create_status_log(self, log_path=None):
+        settings = self.config['Log'] if 'Log' in self.config else {}
+        if log_path is None:
+            log_path = settings.get('log_file', 'email_processor.log')
+            if log_path and not os.path.isabs(log_path):
+                log_path = os.path.join(get_base_dir(), log_path)
+        return StatusLog(
+            log_path or None,
+            max_lines=int(settings.get('max_lines', 1000)),
+            max_bytes=parse_size(settings.get('max_bytes', '5MB')) or 5 * 1024 * 1024,
+            backup_count=int(settings.get('backup_count', 3))
+        )
+
+    def update_status(self, message):
+        # Messages land in the ring buffer and log file right away; the widgets
+        # are redrawn at most every REFRESH_INTERVAL. Processing blocks the
+        # event loop, so a due redraw happens here, the trailing one via after().
+        self.status_log.append(message)
+        self.latest_status = message
+        if time.perf_counter() - self.last_refresh >= REFRESH_INTERVAL:
+            self.refresh_log()
+            self.root.update_idletasks()
+        elif not self.refresh_pending:
+            self.refresh_pending = True
+            self.root.after(int(REFRESH_INTERVAL * 1000), self.refresh_log)
+
+    def refresh_log(self):
+        self.refresh_pending = False
+        self.last_refresh = time.perf_counter()
+        self.status_var.set(self.latest_status)
+        log = self.status_log
+        log.flush()
+        if log.total == self.rendered_total and log.cleared == self.rendered_cleared:
+            return
+
+        lines = log.new_lines(self.rendered_total) if log.cleared == self.rendered_cleared else None
+        if lines is None:
+            # Cleared or overrun: redraw the whole buffer
+            self.log_text.delete('1.0', tk.END)
+            if log.lines:
+                self.log_text.insert(tk.END, '\n'.join(log.lines) + '\n')
+            self.rendered_lines = len(log.lines)
+        else:
+            self.log_text.insert(tk.END, '\n'.join(lines) + '\n')
+            self.rendered_lines += len(lines)
+            excess = self.rendered_lines - log.max_lines
+            if excess > 0:
+                self.log_text.delete('1.0', f'{excess + 1}.0')
+                self.rendered_lines -= excess
+        self.rendered_total = log.total
+        self.rendered_cleared = log.cleared
+        self.log_text.see(tk.END)
+
+    def clear_log(self):
+        self.status_log.clear()
+        self.refresh_log()
+
+    def on_close(self):
+        self.status_log.close()
+        self.root.destroy()
+
+    def get_date_range(self):
+        # (start_date, end_date) from the Process tab, None after showing an error
+        start_date = None
+        end_date = None
+
+        if self.start_date_var.get().strip():
+            try:
+                start_date = datetime.datetime.strptime(self.start_date_var.get().strip(), "%Y-%m-%d")
+            except ValueError:
+                messagebox.showerror("Date Error", "Invalid start date format. Use YYYY-MM-DD")
+                return None
+
+        if self.end_date_var.get().strip():
+            try:
+                end_date = datetime.datetime.strptime(self.end_date_var.get().strip(), "%Y-%m-%d")
+                # Add one day to include emails from the end date
+                end_date += datetime.timedelta(days=1)
+            except ValueError:
+                messagebox.showerror("Date Error", "Invalid end date format. Use YYYY-MM-DD")
+                return None
+        return start_date, end_date
+
+    def plan_emails(self):
+        # Dry run: report what Process Emails would download without fetching bodies
+        dates = self.get_date_range()
+        if dates is None:
+            return
+        start_date, end_date = dates
+        if not self.email_var.get() or not self.password_var.get():
+            messagebox.showerror("Input Error", "Email and password are required")
+            return
+
+        self.tab_control.select(self.log_tab)
+        self.update_status("Connecting to email server...")
+        try:
+            with imaplib.IMAP4_SSL('imap.gmail.com') as mail:
+                self.update_status("Logging in...")
+                mail.login(self.email_var.get(), self.password_var.get())
+                mail.select('inbox')
+                plan = plan_mailbox(
+                    mail,
+                    self.config,
+                    self.excel_var.get() or os.path.join(get_base_dir(), 'email_attachment_report.xlsx'),
+                    report_format=self.format_var.get(),
+                    subject_keyword=self.subject_var.get(),
+                    start_date=start_date,
+                    end_date=end_date,
+                    unread_only=self.unread_var.get(),
+                    status_callback=self.update_status
+                )
+                messagebox.showinfo("Plan", "\n".join(plan.lines()))
+        except imaplib.IMAP4.error as login_error:
+            error_msg = f"IMAP Login Error: {login_error}"
+            self.update_status(error_msg)
+            messagebox.showerror("Login Error", error_msg)
+        except Exception as e:
+            error_msg = f"Unexpected error: {e}"
+            self.update_status(error_msg)
+            messagebox.showerror("Error", error_msg)
+
+    def process_emails(self):
+        try:
+            dates = self.get_date_range()
+            if dates is None:
+                return
+            start_date, end_date = dates
+
+            # Validate required fields
+            if not self.email_var.get() or not self.password_var.get():
+                messagebox.showerror("Input Error", "Email and password are required")
+                return
+            
+            # Create attachments directory if needed
+            attachments_dir = self.dir_var.get()
+            if not attachments_dir:
+                attachments_dir = create_attachments_dir(get_base_dir())
+            else:
+                os.makedirs(attachments_dir, exist_ok=True)
+            
+            self.update_status("Connecting to email server...")
+            
+            # Process in a separate thread to avoid freezing UI
+            self.tab_control.select(self.log_tab)  # Switch to log tab
+            
+            # Connect to email
+            try:
+                with imaplib.IMAP4_SSL('imap.gmail.com') as mail:
+                    self.update_status("Logging in...")
+                    mail.login(self.email_var.get(), self.password_var.get())
+                    self.update_status("Connected successfully")
+                    
+                    mail.select('inbox')
+                    self.update_status("Searching for emails...")
+                    
+                    output_file = self.excel_var.get()
+                    if not output_file:
+                        output_file = os.path.join(get_base_dir(), 'email_attachment_report.xlsx')
+                    
+                    if get_shard_workers(self.config) > 1 and start_date:
+                        email_address = self.email_var.get()
+                        password = self.password_var.get()
+                        emails = process_sharded(
+                            mail,
+                            lambda: connect_mailbox(email_address, password),
+                            self.config,
+                            attachments_dir,
+                            output_file,
+                            report_format=self.format_var.get(),
+                            subject_keyword=self.subject_var.get(),
+                            start_date=start_date,
+                            end_date=end_date,
+                            unread_only=self.unread_var.get(),
+                            status_callback=self.update_status,
+                            account=email_address
+                        )
+                    else:
+                        emails = process_mailbox(
+                            mail,
+                            self.config,
+                            attachments_dir,
+                            output_file,
+                            report_format=self.format_var.get(),
+                            subject_keyword=self.subject_var.get(),
+                            start_date=start_date,
+                            end_date=end_date,
+                            unread_only=self.unread_var.get(),
+                            status_callback=self.update_status
+                        )
+                    
+                    if emails:
+                        messagebox.showinfo("Process Complete", f"Successfully processed {len(emails)} emails")
+                    else:
+                        self.update_status("No emails were found or processed")
+                        messagebox.showinfo("Process Complete", "No emails were found matching your criteria")
+            
+            except imaplib.IMAP4.error as login_error:
+                error_msg = f"IMAP Login Error: {login_error}"
+                self.update_status(error_msg)
+                messagebox.showerror("Login Error", error_msg)
+            
+            except Exception as e:
+                error_msg = f"Unexpected error: {e}"
+                self.update_status(error_msg)
+                messagebox.showerror("Error", error_msg)
+        
+        except Exception as e:
+            messagebox.showerror("Error", f"An unexpected error occurred: {e}")
+
+
+def run_gui():
+    root = tk.Tk()
+    app = EmailProcessorApp(root)
+    root.mainloop()
@@ -0,0 +1,173 @@
+import imaplib
+import re
+import time
+
+
+FETCH_ITEM_RE = re.compile(rb'^(\d+)\s+\(')
+
+
+class AdaptiveFetchController:
+    # AIMD controller for FETCH batch sizing: grow the batch additively while
+    # the server keeps up, cut it in half as soon as a batch is slow, too
+    # large or throttled.
+    def __init__(
+            self,
+            initial_batch=10,
+            min_batch=1,
+            max_batch=200,
+            increase_step=5,
+            decrease_factor=0.5,
+            target_latency=2.0,
+            max_batch_bytes=25 * 1024 * 1024,
+            max_backoff=60.0,
+            max_throttle_retries=5
+    ):
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.target_latency = target_latency
+        self.max_batch_bytes = max_batch_bytes
+        self.max_backoff = max_backoff
+        self.max_throttle_retries = max_throttle_retries
+
+        self.batch_size = max(min_batch, min(max_batch, int(initial_batch)))
+        self.initial_batch = self.batch_size
+        self.peak_batch_size = self.batch_size
+        self.lowest_batch_size = self.batch_size
+        self.backoff = 0.0
+        self.consecutive_throttles = 0
+
+        self.batches = 0
+        self.messages = 0
+        self.bytes = 0
+        self.fetch_seconds = 0.0
+        self.throttle_events = 0
+        self.skipped = 0
+
+    def _increase(self):
+        self.batch_size = min(self.max_batch, self.batch_size + self.increase_step)
+        self.peak_batch_size = max(self.peak_batch_size, self.batch_size)
+
+    def _decrease(self):
+        self.batch_size = max(self.min_batch, int(self.batch_size * self.decrease_factor))
+        self.lowest_batch_size = min(self.lowest_batch_size, self.batch_size)
+
+    def record_batch(self, count, nbytes, latency):
+        self.batches += 1
+        self.messages += count
+        self.bytes += nbytes
+        self.fetch_seconds += latency
+        self.consecutive_throttles = 0
+        self.backoff = 0.0
+
+        # Any healthy batch probes upwards again, so the size recovers after
+        # a throttle or a slow batch instead of staying cut for the whole run
+        if latency > self.target_latency or nbytes > self.max_batch_bytes:
+            self._decrease()
+        else:
+            self._increase()
+
+    def record_throttle(self):
+        # Returns the delay to wait before retrying, or None once we give up
+        self.throttle_events += 1
+        self.consecutive_throttles += 1
+        if self.consecutive_throttles > self.max_throttle_retries:
+            return None
+        self._decrease()
+        self.backoff = min(self.max_backoff, self.backoff * 2 if self.backoff else 1.0)
+        return self.backoff
+
+    def isolate(self):
+        # Retries are used up: drop to the smallest batch, so a message the
+        # server always refuses can be told apart from its neighbours
+        self.batch_size = self.min_batch
+        self.lowest_batch_size = self.min_batch
+        self.consecutive_throttles = 0
+        self.backoff = 0.0
+
+    def record_skip(self, count):
+        self.skipped += count
+        self.consecutive_throttles = 0
+        self.backoff = 0.0
+
+    def metrics(self):
+        return {
+            'batch_size': self.batch_size,
+            'initial_batch_size': self.initial_batch,
+            'peak_batch_size': self.peak_batch_size,
+            'lowest_batch_size': self.lowest_batch_size,
+            'in_flight': 1,
+            'batches': self.batches,
+            'messages_fetched': self.messages,
+            'bytes_fetched': self.bytes,
+            'fetch_seconds': round(self.fetch_seconds, 3),
+            'throughput_bps': round(self.bytes / self.fetch_seconds, 1) if self.fetch_seconds else 0.0,
+            'throttle_events': self.throttle_events,
+            'messages_unfetchable': self.skipped
+        }
+
+
+def parse_fetch_response(data):
+    # imaplib returns a flat list mixing (header, literal) tuples and b')'
+    # terminators; map each literal back to its sequence number
+    messages = {}
+    for item in data:
+        if not isinstance(item, tuple) or len(item) < 2:
+            continue
+        match = FETCH_ITEM_RE.match(item[0])
+        if match:
+            messages[int(match.group(1))] = item[1]
+    return messages
+
+
+def response_size(data):
+    return sum(
+        sum(len(part) for part in item if part) if isinstance(item, tuple) else len(item or b'')
+        for item in data
+    )
+
+
+def fetch_messages(mail, nums, controller=None, query='(RFC822)', parse_response=parse_fetch_response):
+    # Yields (num, item) in the order of nums, where item is what
+    # parse_response maps that sequence number to (the literal by default);
+    # None when the server returned nothing for that message or refused it.
+    # Only a dropped connection (IMAP4.abort) is raised.
+    if controller is None:
+        controller = AdaptiveFetchController()
+    nums = list(nums)
+    pos = 0
+    while pos < len(nums):
+        batch = nums[pos:pos + controller.batch_size]
+        message_set = ','.join(n.decode() if isinstance(n, bytes) else str(n) for n in batch)
+
+        started = time.perf_counter()
+        try:
+            result, data = mail.fetch(message_set, query)
+        except imaplib.IMAP4.abort:
+            raise
+        except imaplib.IMAP4.error as fetch_error:
+            result, data = 'NO', [str(fetch_error).encode()]
+        latency = time.perf_counter() - started
+
+        if result != 'OK':
+            delay = controller.record_throttle()
+            if delay is not None:
+                time.sleep(delay)
+            elif len(batch) > controller.min_batch:
+                controller.isolate()
+            else:
+                # The server keeps refusing these messages (e.g. "Some messages
+                # could not be FETCHed"); hand back None so the caller counts
+                # them as failed and the rest of the run carries on
+                controller.record_skip(len(batch))
+                pos += len(batch)
+                for num in batch:
+                    yield num, None
+            continue
+
+        messages = parse_response(data)
+        controller.record_batch(len(batch), response_size(data), latency)
+        pos += len(batch)
+        for num in batch:
+            yield num, messages.get(int(num))
@@ -0,0 +1,161 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+
+def parse_raw(raw_email, attachment_rules=None):
+    # Imported here so worker processes only load what parsing needs and the
+    # pipeline module can import this one without a cycle
+    from pipeline import parse_message
+    try:
+        if raw_email is None:
+            raise ValueError("server returned no message data")
+        return parse_message(raw_email, attachment_rules)
+    except Exception as e:
+        return e
+
+def parse_shared(name, spans, attachment_rules=None):
+    # Runs in a worker: attach to the batch buffer and parse each message
+    # straight out of it, nothing but (offset, length) pairs crossed the pipe
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        results = []
+        for offset, length in spans:
+            if length < 0:
+                results.append(parse_raw(None))
+            else:
+                results.append(parse_raw(bytes(block.buf[offset:offset + length]), attachment_rules))
+        return results
+    finally:
+        block.close()
+
+
+class PendingParse:
+    # One submitted chunk. result() waits for the workers, then frees the
+    # shared memory block the chunk was copied into.
+    def __init__(self, futures=(), block=None, results=None):
+        self.futures = list(futures)
+        self.block = block
+        self.results = results
+
+    def result(self):
+        if self.results is None:
+            try:
+                results = []
+                for future in self.futures:
+                    results.extend(future.result())
+                self.results = results
+            finally:
+                self.release()
+        return self.results
+
+    def release(self):
+        if self.block is not None:
+            self.block.close()
+            self.block.unlink()
+            self.block = None
+
+
+class ParsePool:
+    # MIME parsing (message_from_bytes, decode_header, walk, HTML to text) is
+    # pure Python and CPU bound. With workers > 1 each chunk of fetched
+    # messages is copied once into a shared memory block and parsed by a pool
+    # of processes; with workers <= 1 it runs inline.
+    def __init__(self, workers=1, chunk_size=None, attachment_rules=None):
+        if not workers or workers < 1:
+            workers = os.cpu_count() or 1
+        self.workers = workers
+        self.chunk_size = chunk_size or max(1, workers * 8)
+        self.attachment_rules = attachment_rules
+        # Time the caller spent parsing inline or waiting on the workers
+        self.parse_seconds = 0.0
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def parse(self, raw_emails):
+        # Returns a ParsedEmail or the exception raised for each raw message
+        return self.wait(self.submit(raw_emails))
+
+    def submit(self, raw_emails):
+        # Starts parsing a chunk and returns without waiting for the workers
+        if self.workers <= 1 or len(raw_emails) < 2:
+            started = time.perf_counter()
+            results = [parse_raw(raw_email, self.attachment_rules) for raw_email in raw_emails]
+            self.parse_seconds += time.perf_counter() - started
+            return PendingParse(results=results)
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+        spans = []
+        offset = 0
+        for raw_email in raw_emails:
+            if raw_email is None:
+                spans.append((offset, -1))
+            else:
+                spans.append((offset, len(raw_email)))
+                offset += len(raw_email)
+
+        block = shared_memory.SharedMemory(create=True, size=max(1, offset))
+        try:
+            for raw_email, (start, length) in zip(raw_emails, spans):
+                if length > 0:
+                    block.buf[start:start + length] = raw_email
+
+            # One task per worker keeps IPC to a handful of messages per chunk
+            step = -(-len(spans) // self.workers)
+            futures = [
+                self._executor.submit(parse_shared, block.name, spans[i:i + step], self.attachment_rules)
+                for i in range(0, len(spans), step)
+            ]
+        except BaseException:
+            block.close()
+            block.unlink()
+            raise
+        return PendingParse(futures, block)
+
+    def wait(self, pending):
+        started = time.perf_counter()
+        try:
+            return pending.result()
+        finally:
+            self.parse_seconds += time.perf_counter() - started
+
+    def parse_ahead(self, fetched):
+        # (num, raw_email) pairs in, (num, raw_email, parsed) out, in order.
+        # Each chunk is submitted before the next one is pulled from fetched,
+        # so the workers parse while the connection downloads.
+        in_flight = []
+        try:
+            chunk = []
+            for item in fetched:
+                chunk.append(item)
+                if len(chunk) >= self.chunk_size:
+                    in_flight.append((chunk, self.submit([raw_email for _, raw_email in chunk])))
+                    chunk = []
+                    if len(in_flight) > 1:
+                        yield from self.collect(in_flight.pop(0))
+            if chunk:
+                in_flight.append((chunk, self.submit([raw_email for _, raw_email in chunk])))
+            while in_flight:
+                yield from self.collect(in_flight.pop(0))
+        finally:
+            # Abandoned part way, e.g. the connection dropped
+            for _, submitted in in_flight:
+                submitted.release()
+
+    def collect(self, pending):
+        chunk, submitted = pending
+        for (num, raw_email), parsed in zip(chunk, self.wait(submitted)):
+            yield num, raw_email, parsed
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -0,0 +1,504 @@
+import email
+from email.utils import parsedate_to_datetime
+import os
+import datetime
+import functools
+import re
+import threading
+import time
+import uuid
+from fetch_controller import AdaptiveFetchController, fetch_messages
+from attachment_writer import AttachmentWriter
+from report_writers import write_report
+from dedup_index import content_hash, content_key, email_keys, normalize_message_id, skip_seen_messages
+from records import AttachmentPart, EmailRecord, ParsedEmail
+from parse_pool import ParsePool
+from charsets import decode_bytes, decode_header_value
+
+
+def create_attachments_dir(base_dir, name='email_attachments'):
+    attachments_dir = os.path.join(base_dir, name)
+    os.makedirs(attachments_dir, exist_ok=True)
+    return attachments_dir
+
+@functools.lru_cache(maxsize=4096)
+def parse_email_date(email_date):
+    try:
+        return parsedate_to_datetime(email_date)
+    except (TypeError, ValueError):
+        try:
+            # Fall back to dateutil for dates that aren't RFC 2822
+            from dateutil import parser as date_parser
+            return date_parser.parse(email_date.split('(')[0].strip())
+        except Exception:
+            print(f"Couldn't parse date:{email_date}, using current date")
+            return datetime.datetime.now()
+
+def month_folder_name(email_date):
+    if isinstance(email_date, str):
+        email_date = parse_email_date(email_date)
+    # If email_date is already a datetime object it is used as is
+    return email_date.strftime("%B %Y")
+
+def get_month_folder(attachments_dir, email_date):
+    try:
+        month_folder_path = os.path.join(attachments_dir, month_folder_name(email_date))
+        os.makedirs(month_folder_path, exist_ok=True)
+        return month_folder_path
+    except Exception as e:
+        print(f"Error creating month folder: {e}")
+        return attachments_dir
+
+def safe_filename(filename):
+    try:
+        filename = decode_header_value(filename)
+    except Exception:
+        filename = f"attachment_{uuid.uuid4()}"
+    return re.sub(r'[^\w\-_\.]','_', filename)
+
+def attachment_filename(part):
+    filename = part.get_filename()
+    if not filename:
+        return None
+    return safe_filename(filename)
+
+def save_attachment(attachment, attachments_dir, email_date=None, writer=None):
+    # With a writer the returned list holds a Future per attachment instead of a path
+    saved_attachments = []
+    filename = attachment.filename
+    try:
+        if email_date:
+            save_dir = get_month_folder(attachments_dir, email_date)
+        else:
+            save_dir = attachments_dir
+
+        payload = attachment.payload
+        if payload is None:
+            raise ValueError("attachment has no payload")
+        if writer is not None:
+            saved_attachments.append(writer.submit(payload, save_dir, filename))
+            return saved_attachments
+
+        filepath = os.path.join(save_dir, filename)
+        counter = 1
+        base, ext = os.path.splitext(filepath)
+        while os.path.exists(filepath):
+            filepath = f"{base}_{counter}{ext}"
+            counter += 1
+
+        with open(filepath, 'wb') as f:
+            f.write(payload)
+
+        saved_attachments.append(filepath)
+        return saved_attachments
+    except Exception as e:
+        print(f"Error saving attachment {filename}: {e}")
+        return saved_attachments
+
+def clean_subject(subject):
+    if subject:
+        return decode_header_value(subject)
+    return ''
+
+def html_to_text(html_content):
+    # Imported on first HTML part; bs4 is the slowest import of the CLI path
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    for script in soup(["script", "style"]):
+        script.decompose()
+
+    text = soup.get_text(separator=' ', strip=True)
+
+    return re.sub(r'\s+', ' ', text).strip()
+
+def extract_email_content(email_message):
+    email_content = ""
+
+    if isinstance(email_message, str):
+        try:
+            email_message = email.message_from_string(email_message)
+        except Exception as e:
+            print(f"Could not parse email message: {e}")
+            return ""
+
+    if email_message.is_multipart():
+        for part in email_message.walk():
+            content_type = part.get_content_type()
+
+            if content_type == 'text/plain':
+                try:
+                    payload = part.get_payload(decode=True)
+                    email_content += decode_bytes(payload, part.get_content_charset()) + "\n\n"
+                except Exception as e:
+                    print(f"Error decoding plain text part: {e}")
+
+            elif content_type == 'text/html':
+                try:
+                    payload = part.get_payload(decode=True)
+                    email_content += html_to_text(decode_bytes(payload, part.get_content_charset())) + "\n\n"
+                except Exception as e:
+                    print(f"Error processing HTML content: {e}")
+
+    else:
+        content_type = email_message.get_content_type()
+        try:
+            payload = email_message.get_payload(decode=True)
+            charset = email_message.get_content_charset()
+
+            if content_type == 'text/plain':
+                email_content = decode_bytes(payload, charset)
+            elif content_type == 'text/html':
+                email_content = html_to_text(decode_bytes(payload, charset))
+        except Exception as e:
+            print(f"Error processing single-part email: {e}")
+
+    return email_content.strip()
+
+def is_attachment_part(part):
+    if part.get_content_maintype() == 'multipart':
+        return False
+    disposition = part.get('Content-Disposition')
+    if disposition and disposition.startswith('attachment'):
+        return True
+    if part.get_content_type() == 'application/octet-stream' or part.get_content_maintype() == 'application':
+        return True
+    return bool(part.get_filename())
+
+def parse_message(raw_email, attachment_rules=None):
+    # Everything the later stages need from a raw message; runs in parse
+    # worker processes when a ParsePool has workers. Attachment rules are
+    # checked on the part headers, before the payload is decoded.
+    email_message = email.message_from_bytes(raw_email)
+    attachments = []
+    skipped = 0
+    if email_message.is_multipart():
+        for part in email_message.walk():
+            if not is_attachment_part(part):
+                continue
+            filename = attachment_filename(part)
+            if not filename:
+                continue
+            if attachment_rules is not None and not attachment_rules.allows_part(part, filename):
+                skipped += 1
+                continue
+            attachments.append(AttachmentPart(filename, part.get_content_type(), part.get_payload(decode=True)))
+    return ParsedEmail(
+        subject=clean_subject(email_message['Subject']),
+        sender=email_message['From'],
+        date=email_message['Date'],
+        message_id=normalize_message_id(email_message['Message-ID']),
+        content_hash=content_hash(raw_email),
+        content=extract_email_content(email_message),
+        attachments=attachments,
+        skipped_attachments=skipped
+    )
+
+def build_search_criteria(subject_keyword=None, start_date=None, end_date=None, unread_only=False):
+    search_criteria = []
+    if subject_keyword:
+        search_criteria.append(f'SUBJECT "{subject_keyword}"')
+    if start_date:
+        search_criteria.append(f'SINCE "{start_date.strftime("%d-%b-%Y")}"')
+    if end_date:
+        search_criteria.append(f'BEFORE "{end_date.strftime("%d-%b-%Y")}"')
+    if unread_only:
+        search_criteria.append('UNSEEN')
+    return ' '.join(search_criteria) if search_criteria else 'ALL'
+
+
+# Pipeline stages. A run is source -> parse -> filters -> extractor ->
+# attachment sink -> report sink; every stage can be swapped or driven on its own.
+
+class ImapSource:
+    # Runs the SEARCH, drops already indexed Message-IDs and fetches the rest
+    # in adaptive batches
+    def __init__(
+            self,
+            mail,
+            subject_keyword=None,
+            start_date=None,
+            end_date=None,
+            unread_only=False,
+            server_side_subject=True,
+            seen_index=None,
+            controller=None
+    ):
+        self.mail = mail
+        self.search_string = build_search_criteria(
+            subject_keyword if server_side_subject else None,
+            start_date,
+            end_date,
+            unread_only
+        )
+        self.seen_index = seen_index
+        self.controller = controller or AdaptiveFetchController()
+        self.duplicates = 0
+
+    def search(self, emit):
+        emit(f"Executing IMAP search with criteria: {self.search_string}")
+        result, data = self.mail.search(None, self.search_string)
+        if not data or not data[0]:
+            emit("No emails found matching the search criteria")
+            return []
+        nums = data[0].split()
+        emit(f"Found {len(nums)} emails matching search criteria")
+
+        # Drop already processed emails by Message-ID before fetching any body
+        if self.seen_index is not None:
+            nums, _, self.duplicates = skip_seen_messages(self.mail, nums, self.seen_index)
+            if self.duplicates:
+                emit(f"Skipping {self.duplicates} already processed emails")
+        return nums
+
+    def fetch(self, nums):
+        return fetch_messages(self.mail, nums, self.controller)
+
+
+class SubjectFilter:
+    # Client-side subject match, for servers or scripts that don't use SEARCH SUBJECT
+    def __init__(self, subject_keyword):
+        self.subject_keyword = (subject_keyword or '').lower()
+
+    def __call__(self, parsed):
+        return self.subject_keyword in parsed.subject.lower()
+
+
+class DuplicateContentFilter:
+    # Messages without a Message-ID can only be recognised by content; those
+    # with one were already checked by ImapSource. Rows seeded from a report
+    # that predates the index are matched once by Subject/Sender/Date.
+    def __init__(self, seen_index):
+        self.seen_index = seen_index
+        self.run_keys = set()
+        self.duplicates = 0
+
+    def __call__(self, parsed):
+        keys = email_keys(parsed.message_id, parsed.content_hash)
+        if self.seen_index.claim_legacy_row(parsed.subject, parsed.sender, parsed.date, keys):
+            self.duplicates += 1
+            return False
+        if parsed.message_id:
+            return True
+        key = content_key(parsed.content_hash)
+        if key in self.seen_index or key in self.run_keys:
+            self.duplicates += 1
+            return False
+        self.run_keys.add(key)
+        return True
+
+
+def extract_record(parsed):
+    return EmailRecord(
+        subject=parsed.subject,
+        sender=parsed.sender,
+        date=parsed.date,
+        content=parsed.content,
+        message_id=parsed.message_id,
+        content_hash=parsed.content_hash,
+        folder=month_folder_name(parsed.date) if parsed.date else ''
+    )
+
+
+class AttachmentSink:
+    # Saves attachment parts into month folders through an AttachmentWriter
+    def __init__(self, attachments_dir, writer=None):
+        self.attachments_dir = attachments_dir
+        self.owns_writer = writer is None
+        self.writer = writer or AttachmentWriter()
+
+    def save(self, attachments, email_date):
+        futures = []
+        for attachment in attachments:
+            futures.extend(save_attachment(attachment, self.attachments_dir, email_date, writer=self.writer))
+        return futures
+
+    def close(self):
+        if self.owns_writer:
+            self.writer.close()
+
+    def resolve(self, pending, emit):
+        # Wait for the writer so every Attachments cell points at a file on
+        # disk; returns how many attachments could not be saved
+        self.close()
+        failed = 0
+        for record, futures in pending:
+            attachment_paths = []
+            for future in futures:
+                try:
+                    attachment_paths.append(future.result())
+                    emit(f"  - Saved attachment: {os.path.basename(attachment_paths[-1])}")
+                except Exception as e:
+                    failed += 1
+                    emit(f"Error saving attachment for '{record.subject}': {e}")
+            record.attachments = attachment_paths
+        return failed
+
+
+class ReportSink:
+    # Shared by every sink in the process, so concurrent shard workers never
+    # append to the same report at once
+    write_lock = threading.Lock()
+
+    def __init__(self, output_file, report_format='xlsx', seen_index=None):
+        self.output_file = output_file
+        self.report_format = report_format
+        self.seen_index = seen_index
+
+    def write(self, records):
+        with self.write_lock:
+            result = write_report(records, self.output_file, self.report_format)
+            # Only remember emails once they made it into the report
+            if self.seen_index is not None and not result.startswith("Error"):
+                self.seen_index.commit_records(records)
+        return result
+
+
+def run_pipeline(
+        source,
+        filters=(),
+        extractor=extract_record,
+        attachment_sink=None,
+        report_sink=None,
+        status_callback=None,
+        metrics=None,
+        parse_pool=None,
+        search_index=None,
+        text_extractor=None,
+        archive_sink=None
+):
+    started = time.perf_counter()
+    emit = status_callback or (lambda message: None)
+    owns_pool = parse_pool is None
+    if owns_pool:
+        parse_pool = ParsePool(workers=1)
+    try:
+        nums = source.search(emit)
+        if not nums:
+            return []
+
+        email_list = []
+        pending_attachments = []
+        processed = 0
+        failed = 0
+        skipped_attachments = 0
+        parse_started = parse_pool.parse_seconds
+        for num, raw_email, parsed in parse_pool.parse_ahead(source.fetch(nums)):
+            processed += 1
+            emit(f"Processing email {processed}/{len(nums)}")
+            try:
+                if isinstance(parsed, Exception):
+                    raise parsed
+                if not all(keep(parsed) for keep in filters):
+                    continue
+                skipped_attachments += parsed.skipped_attachments
+
+                record = extractor(parsed)
+                # Archive and index first: an email that fails here never
+                # reaches the report or the seen index, so a rerun retries it
+                if archive_sink is not None:
+                    archive_sink.add(raw_email, record)
+                if search_index is not None:
+                    search_index.add(record, [attachment.filename for attachment in parsed.attachments], raw_email)
+                if attachment_sink is not None:
+                    futures = attachment_sink.save(parsed.attachments, record.date)
+                    if futures:
+                        pending_attachments.append((record, futures))
+                email_list.append(record)
+            except Exception as email_error:
+                failed += 1
+                emit(f"Error processing email {num}: {email_error}")
+
+        if attachment_sink is not None:
+            failed += attachment_sink.resolve(pending_attachments, emit)
+        if archive_sink is not None:
+            # Flushed before the report so a reported email is always archived
+            archive_sink.close()
+            emit(archive_sink.summary())
+            if metrics is not None:
+                metrics['raw_archived'] = archive_sink.archived
+                metrics['raw_archive_bytes'] = archive_sink.stored_bytes
+        if text_extractor is not None:
+            text_started = time.perf_counter()
+            text_extractor.extract(email_list, emit)
+            if metrics is not None:
+                metrics['text_extracted'] = text_extractor.extracted
+                metrics['text_cache_hits'] = text_extractor.cache_hits
+                metrics['text_seconds'] = round(time.perf_counter() - text_started, 3)
+        if search_index is not None:
+            search_index.flush()
+
+        fetch_metrics = source.controller.metrics()
+        if metrics is not None:
+            metrics.update(fetch_metrics)
+            metrics['emails_processed'] = len(email_list)
+            # Emails or attachments that errored; a rerun has to pick them up
+            metrics['emails_failed'] = failed
+            metrics['duplicates_skipped'] = source.duplicates + sum(getattr(keep, 'duplicates', 0) for keep in filters)
+            metrics['parse_workers'] = parse_pool.workers
+            metrics['parse_seconds'] = round(parse_pool.parse_seconds - parse_started, 3)
+            metrics['attachments_skipped'] = skipped_attachments
+            metrics['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+        emit(f"Successfully processed {len(email_list)} emails")
+        if skipped_attachments:
+            emit(f"Skipped {skipped_attachments} attachments excluded by the attachment rules")
+        emit(format_fetch_metrics(fetch_metrics))
+
+        if report_sink is not None and email_list:
+            result = report_sink.write(email_list)
+            emit(result)
+            if metrics is not None and result.startswith("Error"):
+                metrics['error'] = result
+        return email_list
+
+    except Exception as search_error:
+        emit(f"Email search error: {search_error}")
+        if metrics is not None:
+            metrics['error'] = str(search_error)
+        return []
+    finally:
+        if attachment_sink is not None:
+            attachment_sink.close()
+        if owns_pool:
+            parse_pool.close()
+
+def format_fetch_metrics(metrics):
+    return (f"Fetched {metrics.get('messages_fetched', 0)} emails "
+            f"({metrics.get('bytes_fetched', 0) / 1024 / 1024:.1f} MB) in {metrics.get('batches', 0)} batches, "
+            f"{metrics.get('throughput_bps', 0) / 1024:.1f} KB/s, batch size {metrics.get('batch_size')} "
+            f"(peak {metrics.get('peak_batch_size')}), {metrics.get('throttle_events', 0)} throttle events")
+
+def search_emails(
+        mail,
+        attachments_dir=None,
+        subject_keyword=None,
+        start_date=None,
+        end_date=None,
+        unread_only=False,
+        status_callback=None,
+        metrics=None,
+        attachment_writer=None,
+        seen_index=None,
+        attachment_rules=None
+):
+    # Convenience wrapper: server-side subject search, attachments saved when
+    # attachments_dir is given, no report written
+    source = ImapSource(
+        mail,
+        subject_keyword=subject_keyword,
+        start_date=start_date,
+        end_date=end_date,
+        unread_only=unread_only,
+        seen_index=seen_index
+    )
+    filters = [DuplicateContentFilter(seen_index)] if seen_index is not None else []
+    attachment_sink = AttachmentSink(attachments_dir, attachment_writer) if attachments_dir else None
+    with ParsePool(workers=1, attachment_rules=attachment_rules) as parse_pool:
+        return run_pipeline(
+            source,
+            filters=filters,
+            attachment_sink=attachment_sink,
+            status_callback=status_callback,
+            metrics=metrics,
+            parse_pool=parse_pool
+        )
@@ -0,0 +1,198 @@
+import datetime
+import gzip
+import hashlib
+import os
+import threading
+from dedup_index import normalize_message_id
+from pipeline import get_month_folder
+
+
+PACK_NAME = 'raw_messages.pack'
+INDEX_NAME = 'raw_messages.idx'
+SEGMENT_SIZE = 1024 * 1024
+
+
+def load_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+def compress(data, codec, level=None):
+    if codec == 'zstd':
+        return load_zstandard().ZstdCompressor(level=level or 10).compress(data)
+    return gzip.compress(data, compresslevel=level or 6)
+
+def decompress(data, codec):
+    if codec == 'zstd':
+        zstandard = load_zstandard()
+        if zstandard is None:
+            raise RuntimeError("This archive segment is zstd compressed, install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+def raw_key(raw_email):
+    # The whole message, headers included: two emails that share a body but
+    # have their own Message-IDs are two entries
+    return hashlib.sha256(raw_email).hexdigest()
+
+def read_index(month_dir):
+    # raw key -> (message_id, segment offset, segment length, offset in
+    # segment, size, codec, content hash); a message archived twice keeps its
+    # last copy
+    entries = {}
+    index_path = os.path.join(month_dir, INDEX_NAME)
+    if not os.path.exists(index_path):
+        return entries
+    with open(index_path, encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                # Torn last line after a crash
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) == 7:
+                # Written when entries were keyed on the body hash
+                fields.append(fields[0])
+            elif len(fields) != 8:
+                continue
+            key, message_id, segment_offset, segment_length, offset, size, codec, content_hash = fields
+            entries[key] = (message_id, int(segment_offset), int(segment_length), int(offset), int(size), codec,
+                            content_hash)
+    return entries
+
+
+class RawArchiveSink:
+    # Keeps every processed raw message in <month folder>/raw_messages.pack,
+    # next to that month's attachments. Messages are grouped into segments of
+    # about segment_size bytes, each compressed on its own (zstd frame or
+    # gzip member), and raw_messages.idx records where every message lives,
+    # so reading one back only decompresses its segment.
+    write_lock = threading.Lock()
+
+    def __init__(self, base_dir, compression='zstd', segment_size=SEGMENT_SIZE, level=None, status_callback=None):
+        self.base_dir = base_dir
+        self.codec = 'zstd' if compression == 'zstd' else 'gzip'
+        if self.codec == 'zstd' and load_zstandard() is None:
+            self.codec = 'gzip'
+            if status_callback:
+                status_callback("zstandard is not installed, archiving raw emails with gzip")
+        self.segment_size = segment_size
+        self.level = level
+        self.segments = {}
+        self.known = {}
+        self.archived = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def add(self, raw_email, record):
+        if not raw_email:
+            return False
+        month_dir = get_month_folder(self.base_dir, record.date or datetime.datetime.now())
+        if month_dir not in self.known:
+            entries = read_index(month_dir)
+            self.known[month_dir] = (set(entries), {entry[0] for entry in entries.values() if entry[0]})
+        keys, message_ids = self.known[month_dir]
+        key = raw_key(raw_email)
+        message_id = normalize_message_id(record.message_id)
+        # The same message again, or a redelivery with its own Received headers
+        if key in keys or (message_id and message_id in message_ids):
+            return False
+        keys.add(key)
+        if message_id:
+            message_ids.add(message_id)
+
+        segment = self.segments.setdefault(month_dir, [])
+        segment.append((key, message_id, record.content_hash, raw_email))
+        if sum(len(entry[3]) for entry in segment) >= self.segment_size:
+            self.flush(month_dir)
+        return True
+
+    def flush(self, month_dir=None):
+        for month in [month_dir] if month_dir else list(self.segments):
+            segment = self.segments.pop(month, None)
+            if segment:
+                self.write_segment(month, segment)
+
+    def write_segment(self, month_dir, segment):
+        data = b''.join(raw for _, _, _, raw in segment)
+        packed = compress(data, self.codec, self.level)
+        with self.write_lock:
+            with open(os.path.join(month_dir, PACK_NAME), 'ab') as pack:
+                segment_offset = pack.seek(0, os.SEEK_END)
+                pack.write(packed)
+            lines = []
+            offset = 0
+            for key, message_id, content_hash, raw in segment:
+                # Message-IDs can't hold tabs or newlines once normalised
+                message_id = (message_id or '').replace('\t', ' ').replace('\n', ' ')
+                lines.append(f"{key}\t{message_id}\t{segment_offset}\t{len(packed)}\t{offset}\t{len(raw)}\t"
+                             f"{self.codec}\t{content_hash or ''}\n")
+                offset += len(raw)
+            # Index last, so an entry never points at data that isn't there
+            with open(os.path.join(month_dir, INDEX_NAME), 'a', encoding='utf-8') as index:
+                index.write(''.join(lines))
+        self.archived += len(segment)
+        self.raw_bytes += len(data)
+        self.stored_bytes += len(packed)
+
+    def close(self):
+        self.flush()
+
+    def summary(self):
+        ratio = self.stored_bytes / self.raw_bytes if self.raw_bytes else 0
+        return (f"Archived {self.archived} raw emails ({self.raw_bytes / 1024 / 1024:.1f} MB -> "
+                f"{self.stored_bytes / 1024 / 1024:.1f} MB {self.codec}, {ratio:.0%})")
+
+
+class RawArchiveReader:
+    # Random access to one month folder's pack
+    def __init__(self, month_dir):
+        self.month_dir = month_dir
+        self.entries = read_index(month_dir)
+        self.by_message_id = {entry[0]: key for key, entry in self.entries.items() if entry[0]}
+        self.by_content_hash = {entry[6]: key for key, entry in self.entries.items() if entry[6]}
+        self._segment_offset = None
+        self._segment = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def resolve(self, key):
+        # Raw key, content hash or Message-ID -> raw key
+        if key in self.entries:
+            return key
+        if key in self.by_content_hash:
+            return self.by_content_hash[key]
+        return self.by_message_id.get(normalize_message_id(key))
+
+    def __contains__(self, key):
+        return self.resolve(key) is not None
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def get(self, key):
+        # Raw bytes by raw key, content hash or Message-ID
+        entry_key = self.resolve(key)
+        if entry_key is None:
+            raise KeyError(key)
+        _, segment_offset, segment_length, offset, size, codec, _ = self.entries[entry_key]
+        if self._segment_offset != segment_offset:
+            # Neighbours usually sit in the same segment, keep the last one
+            with open(os.path.join(self.month_dir, PACK_NAME), 'rb') as pack:
+                pack.seek(segment_offset)
+                self._segment = decompress(pack.read(segment_length), codec)
+            self._segment_offset = segment_offset
+        return self._segment[offset:offset + size]
+
+
+def find_archived_message(base_dir, key):
+    # Looks through every month folder under base_dir; None if not archived
+    for name in sorted(os.listdir(base_dir)):
+        month_dir = os.path.join(base_dir, name)
+        if os.path.isfile(os.path.join(month_dir, INDEX_NAME)):
+            reader = RawArchiveReader(month_dir)
+            if key in reader:
+                return reader.get(key)
+    return None
@@ -0,0 +1,120 @@
+import sys
+
+
+# Report column -> EmailRecord attribute
+COLUMN_ATTRIBUTES = {
+    'Subject': 'subject',
+    'Sender': 'sender',
+    'Date': 'date',
+    'Content': 'content',
+    'Attachments': 'attachments',
+    'Message-ID': 'message_id',
+    'Content-Hash': 'content_hash',
+    'Folder': 'folder',
+    'Attachment Text': 'attachment_text'
+}
+
+
+def intern_value(value):
+    # Senders and month folders repeat across thousands of receipts; interning
+    # keeps one shared string per distinct value
+    if not value:
+        return ''
+    return sys.intern(str(value))
+
+
+class EmailRecord:
+    # One processed email. __slots__ drops the per-instance dict, attachments
+    # stay a list of paths and are only joined when a report row is built.
+    __slots__ = ('subject', 'sender', 'date', 'content', 'attachments', 'message_id', 'content_hash', 'folder',
+                 'attachment_text')
+
+    def __init__(
+            self,
+            subject='',
+            sender='',
+            date='',
+            content='',
+            attachments=None,
+            message_id='',
+            content_hash='',
+            folder='',
+            attachment_text=''
+    ):
+        self.subject = subject or ''
+        self.sender = intern_value(sender)
+        self.date = str(date) if date else ''
+        self.content = content or ''
+        self.attachments = list(attachments) if attachments else []
+        self.message_id = message_id or ''
+        self.content_hash = content_hash or ''
+        self.folder = intern_value(folder)
+        self.attachment_text = attachment_text or ''
+
+    # Mapping-style access so report writers and csv.DictWriter can treat a
+    # record like the dict rows they used to get
+
+    def __getitem__(self, column):
+        if column not in COLUMN_ATTRIBUTES:
+            raise KeyError(column)
+        value = getattr(self, COLUMN_ATTRIBUTES[column])
+        if column == 'Attachments':
+            return '; '.join(value)
+        return value
+
+    def get(self, column, default=None):
+        try:
+            return self[column]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return COLUMN_ATTRIBUTES.keys()
+
+    def __iter__(self):
+        return iter(COLUMN_ATTRIBUTES)
+
+    def to_dict(self):
+        return {column: self[column] for column in COLUMN_ATTRIBUTES}
+
+    def __repr__(self):
+        return f"EmailRecord(subject={self.subject!r}, sender={self.sender!r}, date={self.date!r})"
+
+
+def records_to_columns(records, columns=None):
+    # Column lists hold references to the records' strings; the content text
+    # is never copied
+    columns = columns or list(COLUMN_ATTRIBUTES)
+    batch = {column: [] for column in columns}
+    for record in records:
+        for column in columns:
+            batch[column].append(record.get(column))
+    return batch
+
+
+class AttachmentPart:
+    # Decoded attachment as produced by the parse stage
+    __slots__ = ('filename', 'content_type', 'payload')
+
+    def __init__(self, filename, content_type, payload):
+        self.filename = filename
+        self.content_type = content_type
+        self.payload = payload
+
+
+class ParsedEmail:
+    # Compact result of parsing one raw message; cheap to send back from a
+    # parse worker process
+    __slots__ = ('subject', 'sender', 'date', 'message_id', 'content_hash', 'content', 'attachments',
+                 'skipped_attachments')
+
+    def __init__(self, subject, sender, date, message_id, content_hash, content, attachments, skipped_attachments=0):
+        self.subject = subject
+        self.sender = sender
+        self.date = date
+        self.message_id = message_id
+        self.content_hash = content_hash
+        self.content = content
+        self.attachments = attachments
+        self.skipped_attachments = skipped_attachments
+
@@ -0,0 +1,156 @@
+import csv
+import datetime
+import json
+import os
+import uuid
+from records import records_to_columns
+
+
+REPORT_COLUMNS = ['Subject', 'Sender', 'Date', 'Content', 'Attachments', 'Message-ID', 'Content-Hash', 'Folder',
+                  'Attachment Text']
+REPORT_EXTENSIONS = {
+    'xlsx': '.xlsx',
+    'csv': '.csv',
+    'jsonl': '.jsonl',
+    'parquet': '.parquet'
+}
+
+
+def get_columns(records):
+    columns = list(REPORT_COLUMNS)
+    for record in records:
+        for key in record:
+            if key not in columns:
+                columns.append(key)
+    return columns
+
+def report_path(output_file, report_format):
+    # Keep the configured name but make the extension match the format
+    base, ext = os.path.splitext(output_file)
+    wanted = REPORT_EXTENSIONS[report_format]
+    if ext.lower() in REPORT_EXTENSIONS.values() and ext.lower() != wanted:
+        return base + wanted
+    return output_file if ext else output_file + wanted
+
+def append_to_excel(new_data, output_file):
+    # Duplicates are rejected upstream by the Message-ID index, so existing
+    # rows are kept as they are
+    import pandas as pd
+    if not isinstance(new_data, pd.DataFrame):
+        new_data = pd.DataFrame(records_to_columns(new_data, get_columns(new_data)))
+    try:
+        if os.path.exists(output_file):
+            existing_df = pd.read_excel(output_file)
+            combined_df = pd.concat([existing_df, new_data], ignore_index=True)
+            combined_df.to_excel(output_file, index=False)
+            return f"Appended {len(new_data)} new emails to {output_file}"
+        else:
+            new_data.to_excel(output_file, index=False)
+            return f"Created new file {output_file} with {len(new_data)} emails"
+    except Exception as e:
+        return f"Error appending to Excel: {e}"
+
+def append_to_csv(records, output_file):
+    try:
+        exists = os.path.exists(output_file) and os.path.getsize(output_file) > 0
+        if exists:
+            # Appending never rewrites the file, so reuse the existing header
+            with open(output_file, newline='', encoding='utf-8') as f:
+                columns = next(csv.reader(f), None) or get_columns(records)
+        else:
+            columns = get_columns(records)
+
+        count = 0
+        with open(output_file, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+            if not exists:
+                writer.writeheader()
+            for record in records:
+                writer.writerow(record)
+                count += 1
+        if exists:
+            return f"Appended {count} new emails to {output_file}"
+        return f"Created new file {output_file} with {count} emails"
+    except Exception as e:
+        return f"Error appending to CSV: {e}"
+
+def append_to_jsonl(records, output_file):
+    try:
+        exists = os.path.exists(output_file)
+        count = 0
+        with open(output_file, 'a', encoding='utf-8') as f:
+            for record in records:
+                row = record.to_dict() if hasattr(record, 'to_dict') else record
+                f.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+                count += 1
+        if exists:
+            return f"Appended {count} new emails to {output_file}"
+        return f"Created new file {output_file} with {count} emails"
+    except Exception as e:
+        return f"Error appending to JSON Lines: {e}"
+
+def append_to_parquet(records, output_file, row_group_size=10000):
+    # Parquet files can't be appended to in place, so output_file is a dataset
+    # directory and every run adds one part file made of row groups; pandas and
+    # pyarrow read the directory back as a single table.
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return "Error appending to Parquet: pyarrow is not installed (pip install pyarrow)"
+
+    try:
+        exists = os.path.isdir(output_file) and any(name.endswith('.parquet') for name in os.listdir(output_file))
+        os.makedirs(output_file, exist_ok=True)
+        records = list(records)
+        columns = get_columns(records)
+        schema = pa.schema([(column, pa.string()) for column in columns])
+        part_name = f"part-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+
+        with pq.ParquetWriter(os.path.join(output_file, part_name), schema) as writer:
+            for start in range(0, len(records), row_group_size):
+                batch = records_to_columns(records[start:start + row_group_size], columns)
+                for column, values in batch.items():
+                    batch[column] = [None if value is None else str(value) for value in values]
+                writer.write_table(pa.table(batch, schema=schema))
+        if exists:
+            return f"Appended {len(records)} new emails to {output_file}"
+        return f"Created new file {output_file} with {len(records)} emails"
+    except Exception as e:
+        return f"Error appending to Parquet: {e}"
+
+
+REPORT_WRITERS = {
+    'xlsx': append_to_excel,
+    'csv': append_to_csv,
+    'jsonl': append_to_jsonl,
+    'parquet': append_to_parquet
+}
+
+
+def read_report(output_file, report_format='xlsx'):
+    # Rows of an existing report as dicts of strings; [] when there is none
+    report_format = (report_format or 'xlsx').strip().lower()
+    if report_format not in REPORT_EXTENSIONS:
+        return []
+    path = report_path(output_file, report_format)
+    if not os.path.exists(path):
+        return []
+    if report_format == 'csv':
+        with open(path, newline='', encoding='utf-8') as f:
+            return list(csv.DictReader(f))
+    if report_format == 'jsonl':
+        with open(path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    if report_format == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_table(path).to_pylist()
+    import pandas as pd
+    return pd.read_excel(path, dtype=str, keep_default_na=False).to_dict('records')
+
+
+def write_report(records, output_file, report_format='xlsx'):
+    report_format = (report_format or 'xlsx').strip().lower()
+    if report_format not in REPORT_WRITERS:
+        return f"Error: unknown report format '{report_format}', expected one of: {', '.join(REPORT_WRITERS)}"
+    return REPORT_WRITERS[report_format](records, report_path(output_file, report_format))
@@ -0,0 +1,240 @@
+import datetime
+import email
+from fetch_controller import AdaptiveFetchController, FETCH_ITEM_RE, fetch_messages
+from pipeline import clean_subject, month_folder_name, safe_filename
+
+
+METADATA_QUERY = '(RFC822.SIZE INTERNALDATE BODYSTRUCTURE)'
+# Also asked for while a pre-index report still has unclaimed rows
+ROW_HEADERS_QUERY = '(RFC822.SIZE INTERNALDATE BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE)])'
+# A base64 line is 76 characters plus CRLF for 57 decoded bytes
+BASE64_RATIO = 57 / 78
+
+
+def read_value(data, pos):
+    # One IMAP value starting at data[pos]: a parenthesised list, quoted
+    # string, {n} literal, NIL or atom. Returns (value, next position).
+    while pos < len(data) and data[pos] in b' \r\n':
+        pos += 1
+    if pos >= len(data):
+        return None, pos
+    char = data[pos:pos + 1]
+    if char == b'(':
+        items = []
+        pos += 1
+        while True:
+            while pos < len(data) and data[pos] in b' \r\n':
+                pos += 1
+            if pos >= len(data) or data[pos:pos + 1] == b')':
+                return items, pos + 1
+            value, pos = read_value(data, pos)
+            items.append(value)
+    if char == b'"':
+        value = bytearray()
+        pos += 1
+        while pos < len(data) and data[pos:pos + 1] != b'"':
+            if data[pos:pos + 1] == b'\\':
+                pos += 1
+            value += data[pos:pos + 1]
+            pos += 1
+        return value.decode('utf-8', errors='replace'), pos + 1
+    if char == b'{':
+        end = data.index(b'}', pos)
+        length = int(data[pos + 1:end])
+        start = end + 1
+        while data[start:start + 1] in (b'\r', b'\n'):
+            start += 1
+        return data[start:start + length].decode('utf-8', errors='replace'), start + length
+    end = pos
+    while end < len(data) and data[end] not in b' ()\r\n':
+        if data[end:end + 1] == b'[':
+            # BODY[HEADER.FIELDS (DATE FROM)] holds spaces and parens
+            end = data.index(b']', end)
+        end += 1
+    atom = data[pos:end].decode('utf-8', errors='replace')
+    return (None if atom.upper() == 'NIL' else atom), end
+
+def parse_metadata_response(data):
+    # imaplib splits a response around literals: (head, literal) tuples and
+    # bytes continuations. Glue them back into one stream and read each
+    # "num (KEY value ...)" pair.
+    stream = bytearray()
+    for item in data:
+        if isinstance(item, tuple):
+            stream += b' ' + item[0] + item[1]
+        elif isinstance(item, bytes):
+            stream += b' ' + item
+    messages = {}
+    pos = 0
+    while pos < len(stream):
+        match = FETCH_ITEM_RE.match(bytes(stream[pos:pos + 32]).lstrip())
+        if not match:
+            pos += 1
+            continue
+        pos = stream.index(b'(', pos)
+        items, pos = read_value(stream, pos)
+        messages[int(match.group(1))] = {
+            str(items[i]).upper(): items[i + 1] for i in range(0, len(items) - 1, 2)
+        }
+    return messages
+
+def param_value(params, name):
+    if not isinstance(params, list):
+        return None
+    for i in range(0, len(params) - 1, 2):
+        if str(params[i]).lower() == name:
+            return params[i + 1]
+    return None
+
+def attachment_parts(structure, top_level=True):
+    # (content_type, filename, estimated decoded size) for every part that
+    # parse_message would save: a named leaf part of a multipart message
+    if not isinstance(structure, list) or not structure:
+        return []
+    if isinstance(structure[0], list):
+        parts = []
+        for child in structure:
+            if isinstance(child, list):
+                parts.extend(attachment_parts(child, top_level=False))
+        return parts
+    if top_level or len(structure) < 7:
+        return []
+
+    content_type = f"{structure[0]}/{structure[1]}".lower()
+    if content_type == 'message/rfc822' and len(structure) > 8:
+        return attachment_parts(structure[8], top_level=False)
+
+    extension = 7
+    if content_type.startswith('text/'):
+        extension = 8
+    disposition = structure[extension + 1] if len(structure) > extension + 1 else None
+    filename = None
+    if isinstance(disposition, list) and len(disposition) > 1:
+        filename = param_value(disposition[1], 'filename') or param_value(disposition[1], 'filename*')
+    filename = filename or param_value(structure[2], 'name')
+    if not filename:
+        return []
+
+    try:
+        size = int(structure[6])
+    except (TypeError, ValueError):
+        size = 0
+    if str(structure[5]).lower() == 'base64':
+        size = int(size * BASE64_RATIO)
+    return [(content_type, safe_filename(filename), size)]
+
+def parse_internaldate(value):
+    try:
+        return datetime.datetime.strptime(value.strip(), '%d-%b-%Y %H:%M:%S %z')
+    except (AttributeError, ValueError):
+        return None
+
+def header_row(metadata):
+    # (subject, sender, date) the way parse_message reads them, or None when
+    # the headers weren't fetched
+    for key, value in metadata.items():
+        if key.startswith('BODY[HEADER') and value:
+            headers = email.message_from_string(value)
+            return clean_subject(headers['Subject']), headers['From'], headers['Date']
+    return None
+
+def fetch_metadata(mail, nums, controller=None, query=METADATA_QUERY):
+    # Sizes, arrival dates and MIME structure only; no body is downloaded.
+    # Same batching and BAD/NO back-off as a body fetch.
+    if controller is None:
+        controller = AdaptiveFetchController(initial_batch=200, max_batch=2000)
+    for num, metadata in fetch_messages(mail, nums, controller, query, parse_metadata_response):
+        yield num, metadata or {}
+
+
+class RunPlan:
+    # What a run over the same search would download, grouped by the month
+    # folders the attachments would be saved in
+    def __init__(self):
+        self.folders = {}
+        self.skipped_attachments = 0
+        self.already_reported = 0
+        self.estimated_seconds = None
+        self.history_runs = 0
+
+    def add(self, folder, month, size, attachments):
+        entry = self.folders.setdefault(folder, {
+            'month': month, 'messages': 0, 'bytes': 0, 'attachments': 0, 'attachment_bytes': 0
+        })
+        entry['messages'] += 1
+        entry['bytes'] += size
+        entry['attachments'] += len(attachments)
+        entry['attachment_bytes'] += sum(attachment_size for _, _, attachment_size in attachments)
+
+    def total(self, key):
+        return sum(entry[key] for entry in self.folders.values())
+
+    def estimate(self, history):
+        # Fetch time from past throughput plus per-message processing time
+        runs = [run for run in history if run.get('messages_fetched') and run.get('fetch_seconds')]
+        self.history_runs = len(runs)
+        if not runs:
+            return None
+        fetched_bytes = sum(run.get('bytes_fetched', 0) for run in runs)
+        fetch_seconds = sum(run['fetch_seconds'] for run in runs)
+        messages = sum(run['messages_fetched'] for run in runs)
+        overhead = sum(max(0.0, run.get('elapsed_seconds', 0) - run['fetch_seconds']) for run in runs)
+        seconds = self.total('messages') * overhead / messages
+        if fetched_bytes:
+            seconds += self.total('bytes') * fetch_seconds / fetched_bytes
+        else:
+            seconds += self.total('messages') * fetch_seconds / messages
+        self.estimated_seconds = seconds
+        return seconds
+
+    def lines(self):
+        lines = [
+            f"Plan: {self.total('messages')} emails, {self.total('bytes') / 1024 / 1024:.1f} MB, "
+            f"{self.total('attachments')} attachments ({self.total('attachment_bytes') / 1024 / 1024:.1f} MB)"
+        ]
+        for folder, entry in sorted(self.folders.items(), key=lambda item: item[1]['month']):
+            lines.append(
+                f"  {folder:<16} {entry['messages']:>6} emails {entry['bytes'] / 1024 / 1024:>9.1f} MB "
+                f"{entry['attachments']:>6} attachments {entry['attachment_bytes'] / 1024 / 1024:>9.1f} MB"
+            )
+        if self.already_reported:
+            lines.append(f"{self.already_reported} emails are already in the report and would be skipped")
+        if self.skipped_attachments:
+            lines.append(f"Attachment rules would skip {self.skipped_attachments} attachments")
+        if self.estimated_seconds is None:
+            lines.append("Estimated duration: unknown, no past runs in run_metrics.jsonl")
+        else:
+            minutes, seconds = divmod(int(round(self.estimated_seconds)), 60)
+            lines.append(f"Estimated duration: {minutes}m {seconds:02d}s (from the last {self.history_runs} runs)")
+        return lines
+
+
+def plan_run(source, attachment_rules=None, history=(), status_callback=None):
+    # Dry run: SEARCH (and Message-ID dedup) exactly like a real run, then
+    # bulk-fetch metadata instead of bodies
+    emit = status_callback or (lambda message: None)
+    plan = RunPlan()
+    nums = source.search(emit)
+    seen_index = getattr(source, 'seen_index', None)
+    check_rows = seen_index is not None and seen_index.has_legacy_rows()
+    if nums:
+        emit(f"Fetching sizes and structure of {len(nums)} emails")
+        query = ROW_HEADERS_QUERY if check_rows else METADATA_QUERY
+        for num, metadata in fetch_metadata(source.mail, nums, query=query):
+            row = header_row(metadata) if check_rows else None
+            if row is not None and seen_index.has_legacy_row(*row):
+                plan.already_reported += 1
+                continue
+            arrived = parse_internaldate(metadata.get('INTERNALDATE')) or datetime.datetime.now()
+            attachments = attachment_parts(metadata.get('BODYSTRUCTURE'))
+            if attachment_rules is not None:
+                allowed = [part for part in attachments if attachment_rules.allows(*part)]
+                plan.skipped_attachments += len(attachments) - len(allowed)
+                attachments = allowed
+            try:
+                size = int(metadata.get('RFC822.SIZE') or 0)
+            except ValueError:
+                size = 0
+            plan.add(month_folder_name(arrived), (arrived.year, arrived.month), size, attachments)
+    plan.estimate(history)
+    return plan
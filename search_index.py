@@ -0,0 +1,162 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from dedup_index import normalize_message_id
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS email_fts USING fts5(
+    subject,
+    sender,
+    content,
+    attachments,
+    date UNINDEXED,
+    message_id UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+'''
+
+
+def index_key(record, raw_email=None):
+    # One row per email: its Message-ID, or a hash of the whole message when
+    # there is none. The body alone is shared by look-alike receipts.
+    message_id = normalize_message_id(record.message_id)
+    if message_id:
+        return 'mid:' + message_id
+    if raw_email:
+        return 'raw:' + hashlib.sha256(raw_email).hexdigest()
+    return 'body:' + record.content_hash
+
+def quote_query(text):
+    # Plain words, each quoted, so punctuation like "PT. KAI" can't break the
+    # FTS5 query syntax
+    return ' '.join('"' + token.replace('"', '""') + '"' for token in re.findall(r'\w+', text))
+
+
+class SearchIndex:
+    # Local SQLite FTS5 index over subject, sender, content and attachment
+    # names, filled while the pipeline runs so lookups never touch IMAP. One
+    # instance can be shared by concurrent shard workers: every call goes
+    # through a single connection behind a lock, so writers never contend for
+    # the SQLite file lock.
+    def __init__(self, path, commit_every=500):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.commit_every = commit_every
+        self.pending = 0
+        self.added = 0
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        try:
+            self.connection.executescript(SCHEMA)
+        except sqlite3.OperationalError as e:
+            self.connection.close()
+            raise RuntimeError(f"SQLite build has no FTS5 support: {e}")
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(messages)')]
+        if 'content_hash' in columns:
+            self.migrate_keys()
+
+    def migrate_keys(self):
+        # Indexes built when rows were keyed on the body hash: rekey every row
+        # that has a Message-ID, keep the body hash for the rest
+        message_id = 'SELECT message_id FROM email_fts WHERE email_fts.rowid = messages.id'
+        with self.connection:
+            self.connection.execute('ALTER TABLE messages RENAME COLUMN content_hash TO key')
+            self.connection.execute(
+                f"UPDATE OR IGNORE messages SET key = 'mid:' || ({message_id}) WHERE COALESCE(({message_id}), '') != ''"
+            )
+            self.connection.execute("UPDATE messages SET key = 'body:' || key WHERE key NOT LIKE 'mid:%'")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add(self, record, attachment_names=(), raw_email=None):
+        # Keyed by index_key, so re-processing a message never duplicates it
+        with self.lock:
+            cursor = self.connection.execute(
+                'INSERT OR IGNORE INTO messages (key) VALUES (?)',
+                (index_key(record, raw_email),)
+            )
+            if cursor.rowcount == 0:
+                return False
+            self.connection.execute(
+                'INSERT INTO email_fts (rowid, subject, sender, content, attachments, date, message_id) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (
+                    cursor.lastrowid,
+                    record.subject,
+                    record.sender,
+                    record.content,
+                    ' '.join(attachment_names),
+                    record.date,
+                    record.message_id
+                )
+            )
+            self.added += 1
+            self.pending += 1
+            if self.pending >= self.commit_every:
+                self.flush()
+            return True
+
+    def flush(self):
+        with self.lock:
+            self.connection.commit()
+            self.pending = 0
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.flush()
+                self.connection.close()
+                self.connection = None
+
+    def count(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+
+    def query(self, text, limit=20, by_rank=False):
+        # Newest first stays fast for common words; bm25 ranking has to score
+        # every match before the LIMIT applies
+        sql = (
+            "SELECT date, sender, subject, attachments, "
+            "snippet(email_fts, 2, '[', ']', ' ... ', 12) "
+            f"FROM email_fts WHERE email_fts MATCH ? ORDER BY {'rank' if by_rank else 'rowid DESC'} LIMIT ?"
+        )
+        with self.lock:
+            try:
+                return self.connection.execute(sql, (text, limit)).fetchall()
+            except sqlite3.OperationalError:
+                # Not valid FTS5 syntax, search for the words instead
+                quoted = quote_query(text)
+                if not quoted:
+                    return []
+                return self.connection.execute(sql, (quoted, limit)).fetchall()
+
+
+def run_query(index_path, text, limit=20, by_rank=False):
+    if not os.path.exists(index_path):
+        print(f"No search index at {index_path}, process some emails first")
+        return
+    with SearchIndex(index_path) as index:
+        started = time.perf_counter()
+        rows = index.query(text, limit, by_rank)
+        elapsed = time.perf_counter() - started
+        total = index.count()
+    for date, sender, subject, attachments, snippet in rows:
+        print(f"{date} | {sender} | {subject}")
+        print(f"    {' '.join(snippet.split())}")
+        if attachments:
+            print(f"    Attachments: {attachments}")
+    print(f"{len(rows)} results from {total} indexed emails in {elapsed * 1000:.1f} ms")
@@ -0,0 +1,161 @@
+import datetime
+import hashlib
+import json
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor, wait
+from pipeline import build_search_criteria, month_folder_name
+
+
+class Shard:
+    # One SINCE/BEFORE date window; end is exclusive like IMAP BEFORE
+    def __init__(self, start, end, count=0):
+        self.start = start
+        self.end = end
+        self.count = count
+
+    @property
+    def key(self):
+        return f"{self.start:%Y%m%d}-{self.end:%Y%m%d}"
+
+    @property
+    def label(self):
+        last_day = self.end - datetime.timedelta(days=1)
+        return f"{self.start:%Y-%m-%d}..{last_day:%Y-%m-%d}"
+
+    def __repr__(self):
+        return f"Shard({self.label}, {self.count} emails)"
+
+
+def month_windows(start_date, end_date):
+    # [start, end) split at month boundaries, so every shard fills exactly
+    # one attachments month folder
+    start = datetime.datetime(start_date.year, start_date.month, start_date.day)
+    end = datetime.datetime(end_date.year, end_date.month, end_date.day)
+    windows = []
+    while start < end:
+        next_month = datetime.datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+        windows.append((start, min(next_month, end)))
+        start = next_month
+    return windows
+
+def search_key(subject_keyword, unread_only, account='', mailbox='inbox'):
+    # Checkpoints only count for the account, mailbox and search they were
+    # made with
+    criteria = build_search_criteria(subject_keyword, unread_only=unread_only)
+    scope = '\x1f'.join([account.strip().lower(), mailbox.strip().lower(), criteria])
+    return hashlib.blake2b(scope.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class ShardCheckpoints:
+    # One small JSON file per finished shard under <directory>/<search key>/
+    def __init__(self, directory, key):
+        self.directory = os.path.join(directory, key)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, shard):
+        return os.path.join(self.directory, shard.key + '.done')
+
+    def is_done(self, shard):
+        return os.path.exists(self.path(shard))
+
+    def mark_done(self, shard, metrics):
+        # A window that reaches today can still receive mail, never close it
+        if shard.end > datetime.datetime.now():
+            return False
+        temp_path = self.path(shard) + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'start': shard.start.isoformat(), 'end': shard.end.isoformat(),
+                       'count': shard.count, 'metrics': metrics}, f)
+        os.replace(temp_path, self.path(shard))
+        return True
+
+
+def count_messages(mail, subject_keyword, start, end, unread_only):
+    criteria = build_search_criteria(subject_keyword, start, end, unread_only)
+    result, data = mail.search(None, criteria)
+    if result != 'OK' or not data or not data[0]:
+        return 0
+    return len(data[0].split())
+
+def plan_shards(
+        mail,
+        subject_keyword,
+        start_date,
+        end_date,
+        unread_only=False,
+        target_size=500,
+        checkpoints=None,
+        status_callback=None
+):
+    # Month windows, halved until each holds at most target_size emails (or
+    # is a single day). Checkpointed windows are skipped without a SEARCH;
+    # empty ones are never checkpointed, mail can still be moved into them or
+    # marked unread.
+    emit = status_callback or (lambda message: None)
+    shards = []
+    skipped = 0
+    pending = list(reversed(month_windows(start_date, end_date)))
+    while pending:
+        start, end = pending.pop()
+        shard = Shard(start, end)
+        if checkpoints is not None and checkpoints.is_done(shard):
+            skipped += 1
+            continue
+        shard.count = count_messages(mail, subject_keyword, start, end, unread_only)
+        days = (end - start).days
+        if shard.count > target_size and days > 1:
+            middle = start + datetime.timedelta(days=days // 2)
+            pending.append((middle, end))
+            pending.append((start, middle))
+        elif shard.count:
+            shards.append(shard)
+    emit(f"Planned {len(shards)} shards with {sum(shard.count for shard in shards)} emails"
+         + (f", {skipped} already completed" if skipped else ""))
+    return shards
+
+def run_shards(shards, process_shard, workers=4, checkpoints=None, status_callback=None):
+    # process_shard(shard, emit) runs in a worker thread with its own IMAP
+    # connection and returns (emails, metrics). Worker messages go through a
+    # queue so status_callback is only ever called on this thread.
+    emit = status_callback or (lambda message: None)
+    messages = queue.Queue()
+    results = {}
+
+    def run(shard):
+        prefix = f"[{month_folder_name(shard.start)} {shard.label}] "
+        shard_emit = lambda message: messages.put(prefix + message)
+        emails, metrics = process_shard(shard, shard_emit)
+        if metrics.get('error'):
+            shard_emit(f"Shard failed, it will be retried on the next run: {metrics['error']}")
+        elif metrics.get('emails_failed'):
+            shard_emit(f"{metrics['emails_failed']} emails or attachments failed, "
+                       f"the shard will be retried on the next run")
+        elif checkpoints is not None and checkpoints.mark_done(shard, metrics):
+            shard_emit("Shard complete, checkpoint saved")
+        return emails
+
+    def drain():
+        while True:
+            try:
+                emit(messages.get_nowait())
+            except queue.Empty:
+                return
+
+    emails = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(run, shard): shard for shard in shards}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.1)
+            drain()
+            for future in done:
+                shard = futures[future]
+                try:
+                    results[shard.key] = future.result()
+                except Exception as e:
+                    emit(f"Shard {shard.label} failed: {e}")
+    drain()
+    for shard in shards:
+        emails.extend(results.get(shard.key, []))
+    return emails
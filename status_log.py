@@ -0,0 +1,65 @@
+import collections
+import datetime
+import itertools
+import logging
+import logging.handlers
+import os
+
+
+class StatusLog:
+    # Status messages for the GUI: the newest max_lines stay in memory for the
+    # Log tab, the full history goes to a rotating log file. Writes to the
+    # file are buffered and flushed on every UI refresh or every 256 lines.
+    def __init__(self, log_path=None, max_lines=1000, max_bytes=5 * 1024 * 1024, backup_count=3):
+        self.lines = collections.deque(maxlen=max_lines)
+        self.max_lines = max_lines
+        # Lines appended and clears since creation; the view compares them
+        # with what it last drew
+        self.total = 0
+        self.cleared = 0
+        self.logger = logging.Logger('email_processor.status')
+        self.handler = None
+        self.file_handler = None
+        if log_path:
+            directory = os.path.dirname(log_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.file_handler = logging.handlers.RotatingFileHandler(
+                log_path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+            )
+            self.file_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+            self.handler = logging.handlers.MemoryHandler(256, flushLevel=logging.ERROR, target=self.file_handler)
+            self.logger.addHandler(self.handler)
+
+    def append(self, message):
+        line = f"{datetime.datetime.now().strftime('%H:%M:%S')} - {message}"
+        self.lines.append(line)
+        self.total += 1
+        if self.handler is not None:
+            self.logger.info(message)
+        return line
+
+    def new_lines(self, rendered_total):
+        # Lines added after rendered_total, or None when more arrived than the
+        # buffer keeps and the view has to redraw everything
+        count = self.total - rendered_total
+        if count >= len(self.lines):
+            return None
+        return list(itertools.islice(self.lines, len(self.lines) - count, None))
+
+    def clear(self):
+        self.lines.clear()
+        self.cleared += 1
+
+    def flush(self):
+        if self.handler is not None:
+            self.handler.flush()
+
+    def close(self):
+        if self.handler is not None:
+            # MemoryHandler.close flushes, then forgets its target
+            self.handler.close()
+            self.file_handler.close()
+            self.logger.removeHandler(self.handler)
+            self.handler = None
+            self.file_handler = None
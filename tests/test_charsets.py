@@ -0,0 +1,52 @@
+import base64
+from email.header import Header
+from charsets import decode_bytes, decode_header_value, lookup_codec
+
+
+def b_word(charset, data):
+    return f"=?{charset}?b?{base64.b64encode(data).decode()}?="
+
+
+def test_seven_bit_charsets_are_decoded():
+    assert decode_bytes('こんにちは'.encode('iso-2022-jp'), 'iso-2022-jp') == 'こんにちは'
+    assert decode_bytes('héllo wörld'.encode('utf-7'), 'utf-7') == 'héllo wörld'
+    assert decode_bytes('abc'.encode('utf-16-le'), 'utf-16le') == 'abc'
+
+
+def test_ascii_shortcut_and_fallbacks():
+    assert decode_bytes(b'plain', 'iso-8859-1') == 'plain'
+    assert decode_bytes('café'.encode('utf-8')) == 'café'
+    # Undeclared and not UTF-8: Windows-1252
+    assert decode_bytes('café – 5€'.encode('cp1252'), 'unknown-8bit') == 'café – 5€'
+    assert decode_bytes(b'caf\xc3', 'utf-8') == 'caf�'
+
+
+def test_alias_lookup():
+    assert lookup_codec('ISO-8859-1') == 'cp1252'
+    assert lookup_codec('"GB2312"') == 'gb18030'
+    assert lookup_codec('ks_c_5601-1987') == 'cp949'
+    assert lookup_codec('utf-8*en') == 'utf-8'
+    assert lookup_codec('x-windows-1250') == 'cp1250'
+    assert lookup_codec('unknown') is None
+    assert lookup_codec('no-such-charset') is None
+
+
+def test_encoded_word_in_seven_bit_charset():
+    subject = b_word('iso-2022-jp', 'こんにちは'.encode('iso-2022-jp'))
+    assert decode_header_value(subject) == 'こんにちは'
+
+
+def test_adjacent_words_are_joined():
+    # Whitespace between encoded-words is dropped, text around them is kept
+    assert decode_header_value('=?utf-8?q?Grab?= =?utf-8?q?_Receipt?=') == 'Grab Receipt'
+    assert decode_header_value('Re: =?utf-8?q?caf=C3=A9?= order') == 'Re: café order'
+    # A multi-byte character split across two words
+    data = 'Zahlung für Sie'.encode('utf-8')
+    split = data.index(b'\xbc')
+    subject = b_word('utf-8', data[:split]) + '\r\n ' + b_word('utf-8', data[split:])
+    assert decode_header_value(subject) == 'Zahlung für Sie'
+
+
+def test_header_object():
+    header = Header('Rp 10.000 – Grab', 'utf-8')
+    assert decode_header_value(header) == 'Rp 10.000 – Grab'
@@ -0,0 +1,86 @@
+import csv
+from dedup_index import SeenIndex, content_key, message_id_key
+from pipeline import DuplicateContentFilter, parse_message
+
+
+RAW = (b"From: Grab <no-reply@grab.com>\r\nSubject: Your Grab E-Receipt\r\n"
+       b"Date: Tue, 25 Mar 2025 10:00:00 +0700\r\n\r\nbody\r\n")
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def test_seed_from_report_without_message_ids(tmp_path):
+    # A report written before Message-IDs were recorded
+    report = tmp_path / 'report.csv'
+    write_csv(report, [{'Subject': 'Your Grab E-Receipt', 'Sender': 'Grab <no-reply@grab.com>',
+                        'Date': 'Tue, 25 Mar 2025 10:00:00 +0700', 'Content': 'body', 'Attachments': ''}])
+    seen_index = SeenIndex(str(tmp_path / 'seen.idx'))
+    assert seen_index.seed_from_report(str(report), 'csv') == 1
+
+    duplicate_filter = DuplicateContentFilter(seen_index)
+    assert not duplicate_filter(parse_message(RAW))
+    assert duplicate_filter(parse_message(RAW.replace(b'10:00:00', b'11:00:00').replace(b'body', b'other')))
+
+
+def test_seed_prefers_message_id(tmp_path):
+    report = tmp_path / 'report.csv'
+    write_csv(report, [{'Subject': 's', 'Sender': 'a', 'Date': 'd', 'Message-ID': '<1@x>', 'Content-Hash': 'abc'},
+                       {'Subject': 's', 'Sender': 'a', 'Date': 'e', 'Message-ID': '', 'Content-Hash': 'def'}])
+    seen_index = SeenIndex(str(tmp_path / 'seen.idx'))
+    assert seen_index.seed_from_report(str(report), 'csv') == 2
+    assert message_id_key('1@x') in seen_index
+    assert content_key('abc') not in seen_index
+    assert content_key('def') in seen_index
+    assert not seen_index.has_legacy_rows()
+
+
+def test_legacy_row_matches_one_email(tmp_path):
+    report = tmp_path / 'report.csv'
+    write_csv(report, [{'Subject': 'Your Grab E-Receipt', 'Sender': 'Grab <no-reply@grab.com>',
+                        'Date': 'Tue, 25 Mar 2025 10:00:00 +0700'}])
+    SeenIndex(str(tmp_path / 'seen.idx')).seed_from_report(str(report), 'csv')
+
+    # Seeding survives a restart and is not repeated
+    seen_index = SeenIndex(str(tmp_path / 'seen.idx'))
+    assert not seen_index.is_new
+    assert seen_index.has_legacy_rows()
+    duplicate_filter = DuplicateContentFilter(seen_index)
+    first = parse_message(b"Message-ID: <a@grab.com>\r\n" + RAW)
+    second = parse_message(b"Message-ID: <b@grab.com>\r\n" + RAW.replace(b'body', b'other'))
+    assert not duplicate_filter(first)
+    assert duplicate_filter(second)
+    # The claimed email is now known by its Message-ID instead
+    assert message_id_key('a@grab.com') in seen_index
+    assert not SeenIndex(str(tmp_path / 'seen.idx')).has_legacy_rows()
+
+
+def test_identical_bodies_with_different_message_ids(tmp_path):
+    seen_index = SeenIndex(str(tmp_path / 'seen.idx'))
+    first = parse_message(b"Message-ID: <a@grab.com>\r\n" + RAW)
+    second = parse_message(b"Message-ID: <b@grab.com>\r\n" + RAW)
+    duplicate_filter = DuplicateContentFilter(seen_index)
+    assert duplicate_filter(first) and duplicate_filter(second)
+    seen_index.commit_records([{'Message-ID': first.message_id, 'Content-Hash': first.content_hash}])
+    assert DuplicateContentFilter(seen_index)(second)
+
+
+def test_identical_bodies_without_message_id(tmp_path):
+    seen_index = SeenIndex(str(tmp_path / 'seen.idx'))
+    duplicate_filter = DuplicateContentFilter(seen_index)
+    assert duplicate_filter(parse_message(RAW))
+    assert not duplicate_filter(parse_message(RAW.replace(b'Tue, 25', b'Wed, 26')))
+
+
+def test_existing_index_is_not_seeded(tmp_path):
+    report = tmp_path / 'report.csv'
+    write_csv(report, [{'Subject': 's', 'Sender': 'a', 'Date': 'd'}])
+    index_path = tmp_path / 'seen.idx'
+    index_path.write_text('')
+    seen_index = SeenIndex(str(index_path))
+    assert seen_index.seed_from_report(str(report), 'csv') == 0
+    assert len(seen_index) == 0
@@ -0,0 +1,83 @@
+import imaplib
+import pytest
+import fetch_controller
+from fetch_controller import AdaptiveFetchController, fetch_messages
+
+
+def test_healthy_batches_grow_to_max():
+    controller = AdaptiveFetchController(initial_batch=10, max_batch=30, increase_step=5)
+    for _ in range(10):
+        controller.record_batch(controller.batch_size, 1000, 0.1)
+    assert controller.batch_size == 30
+    assert controller.peak_batch_size == 30
+
+
+def test_slow_or_large_batch_halves():
+    controller = AdaptiveFetchController(initial_batch=40, target_latency=2.0, max_batch_bytes=1000)
+    controller.record_batch(40, 10, 5.0)
+    assert controller.batch_size == 20
+    controller.record_batch(20, 5000, 0.1)
+    assert controller.batch_size == 10
+    assert controller.lowest_batch_size == 10
+
+
+def test_grows_back_after_a_cut():
+    controller = AdaptiveFetchController(initial_batch=100, max_batch=100)
+    controller.record_throttle()
+    assert controller.batch_size == 50
+    for _ in range(10):
+        controller.record_batch(controller.batch_size, 1000, 0.1)
+    assert controller.batch_size == 100
+
+
+def test_throttle_backoff_doubles_then_gives_up():
+    controller = AdaptiveFetchController(initial_batch=64, max_throttle_retries=3, max_backoff=3.0)
+    assert [controller.record_throttle() for _ in range(4)] == [1.0, 2.0, 3.0, None]
+    assert controller.batch_size == 8
+    # A good batch resets the backoff
+    controller.record_batch(8, 100, 0.1)
+    assert controller.record_throttle() == 1.0
+
+
+class RefusingMail:
+    # Answers NO to every FETCH that includes one of the refused messages
+    def __init__(self, count, refused):
+        self.count = count
+        self.refused = set(refused)
+        self.calls = 0
+
+    def fetch(self, message_set, query):
+        self.calls += 1
+        nums = [int(num) for num in message_set.split(',')]
+        if self.refused.intersection(nums):
+            return 'NO', [b'Some messages could not be FETCHed (Failure)']
+        data = []
+        for num in nums:
+            data.append((f'{num} (RFC822 {{5}}'.encode(), b'raw%02d' % num))
+            data.append(b')')
+        return 'OK', data
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(fetch_controller.time, 'sleep', lambda seconds: None)
+
+
+def test_refused_message_is_skipped(no_sleep):
+    mail = RefusingMail(40, [38])
+    controller = AdaptiveFetchController(initial_batch=10)
+    results = dict(fetch_messages(mail, [str(num).encode() for num in range(1, 41)], controller))
+    assert len(results) == 40
+    assert results[b'38'] is None
+    assert results[b'37'] == b'raw37'
+    assert results[b'40'] == b'raw40'
+    assert controller.metrics()['messages_unfetchable'] == 1
+
+
+def test_connection_abort_is_raised():
+    class AbortingMail:
+        def fetch(self, message_set, query):
+            raise imaplib.IMAP4.abort('socket error: EOF')
+
+    with pytest.raises(imaplib.IMAP4.abort):
+        list(fetch_messages(AbortingMail(), [b'1']))
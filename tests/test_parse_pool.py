@@ -0,0 +1,66 @@
+import os
+from email.message import EmailMessage
+from parse_pool import ParsePool, parse_raw
+
+
+def message(i):
+    email_message = EmailMessage()
+    email_message['Subject'] = f'Receipt {i}'
+    email_message['From'] = 'Shop <s@example.com>'
+    email_message['Message-ID'] = f'<{i}@example.com>'
+    email_message.set_content(f'Total {i}')
+    email_message.add_attachment(b'%PDF-1.4 ' + bytes([i]) * 100, maintype='application', subtype='pdf',
+                                 filename=f'receipt_{i}.pdf')
+    return email_message.as_bytes()
+
+
+def describe(result):
+    if isinstance(result, Exception):
+        return type(result).__name__
+    return result.subject, result.message_id, [(part.filename, part.payload) for part in result.attachments]
+
+
+def shm_blocks():
+    return sorted(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else []
+
+
+def test_shared_memory_chunk_with_missing_and_empty_messages():
+    raw_emails = [message(1), None, b'', message(2), message(3)]
+    before = shm_blocks()
+    with ParsePool(workers=2, chunk_size=5) as pool:
+        results = pool.parse(raw_emails)
+    assert [describe(result) for result in results] == [describe(parse_raw(raw)) for raw in raw_emails]
+    assert isinstance(results[1], ValueError)
+    assert results[3].subject == 'Receipt 2'
+    assert results[4].attachments[0].payload == b'%PDF-1.4 ' + bytes([3]) * 100
+    assert shm_blocks() == before
+
+
+def test_parse_ahead_fetches_the_next_chunk_while_parsing():
+    events = []
+
+    def fetch():
+        for num in range(1, 8):
+            events.append(('fetched', num))
+            yield num, None if num == 5 else message(num)
+
+    with ParsePool(workers=2, chunk_size=3) as pool:
+        results = []
+        for num, raw_email, parsed in pool.parse_ahead(fetch()):
+            events.append(('processed', num))
+            results.append((num, describe(parsed)))
+
+    assert [num for num, _ in results] == list(range(1, 8))
+    assert results[4] == (5, 'ValueError')
+    assert results[5][1][0] == 'Receipt 6'
+    # The second chunk was fetched before the first one was handed out
+    assert events.index(('fetched', 6)) < events.index(('processed', 1))
+
+
+def test_abandoned_stream_frees_shared_memory():
+    before = shm_blocks()
+    with ParsePool(workers=2, chunk_size=2) as pool:
+        stream = pool.parse_ahead((num, message(num)) for num in range(1, 7))
+        assert next(stream)[0] == 1
+        stream.close()
+    assert shm_blocks() == before
@@ -0,0 +1,71 @@
+import os
+from dedup_index import content_hash
+from raw_archive import INDEX_NAME, PACK_NAME, RawArchiveReader, RawArchiveSink, find_archived_message, raw_key
+from records import EmailRecord
+
+
+DATE = 'Sun, 05 Jan 2025 10:00:00 +0700'
+BODY = b'\r\nTotal Rp 10.000\r\n'
+
+
+def message(message_id, received='mx1'):
+    return f'Received: from {received}\r\nMessage-ID: <{message_id}>\r\nDate: {DATE}\r\n'.encode() + BODY
+
+
+def record(raw, message_id):
+    return EmailRecord(date=DATE, content_hash=content_hash(raw), message_id=message_id)
+
+
+def test_same_body_different_message_ids(tmp_path):
+    sink = RawArchiveSink(str(tmp_path), compression='gzip')
+    first, second = message('a@grab.com'), message('b@grab.com')
+    assert content_hash(first) == content_hash(second)
+    assert sink.add(first, record(first, 'a@grab.com'))
+    assert sink.add(second, record(second, 'b@grab.com'))
+    sink.close()
+    assert find_archived_message(str(tmp_path), '<a@grab.com>') == first
+    assert find_archived_message(str(tmp_path), '<b@grab.com>') == second
+
+
+def test_duplicates_are_archived_once(tmp_path):
+    sink = RawArchiveSink(str(tmp_path), compression='gzip')
+    raw = message('a@grab.com')
+    assert sink.add(raw, record(raw, 'a@grab.com'))
+    assert not sink.add(raw, record(raw, 'a@grab.com'))
+    # Redelivered through another relay: same Message-ID, new headers
+    redelivered = message('a@grab.com', received='mx2')
+    assert not sink.add(redelivered, record(redelivered, 'a@grab.com'))
+    sink.close()
+
+    # A new sink sees what is on disk
+    sink = RawArchiveSink(str(tmp_path), compression='gzip')
+    assert not sink.add(raw, record(raw, 'a@grab.com'))
+    sink.close()
+    assert sink.archived == 0
+
+    month_dir = os.path.join(str(tmp_path), os.listdir(str(tmp_path))[0])
+    reader = RawArchiveReader(month_dir)
+    assert len(reader) == 1
+    assert reader.get(raw_key(raw)) == raw
+    assert reader.get(content_hash(raw)) == raw
+
+
+def test_reads_index_lines_keyed_on_body_hash(tmp_path):
+    # Entries written before the raw key column existed
+    sink = RawArchiveSink(str(tmp_path), compression='gzip')
+    raw = message('a@grab.com')
+    sink.add(raw, record(raw, 'a@grab.com'))
+    sink.close()
+    month_dir = os.path.join(str(tmp_path), os.listdir(str(tmp_path))[0])
+    index_path = os.path.join(month_dir, INDEX_NAME)
+    with open(index_path, encoding='utf-8') as f:
+        fields = f.read().rstrip('\n').split('\t')
+    old_line = '\t'.join([fields[7]] + fields[1:7])
+    with open(index_path, 'w', encoding='utf-8') as f:
+        f.write(old_line + '\n' + 'torn\t')
+
+    reader = RawArchiveReader(month_dir)
+    assert len(reader) == 1
+    assert reader.get(content_hash(raw)) == raw
+    assert reader.get('a@grab.com') == raw
+    assert os.path.getsize(os.path.join(month_dir, PACK_NAME)) > 0
@@ -0,0 +1,162 @@
+import imaplib
+import json
+import fetch_controller
+from dedup_index import SeenIndex
+from fetch_controller import AdaptiveFetchController
+from pipeline import safe_filename
+from run_plan import attachment_parts, fetch_metadata, parse_metadata_response, plan_run, read_value
+
+
+# FETCH (RFC822.SIZE INTERNALDATE BODYSTRUCTURE) responses shaped the way
+# imaplib returns them: (head, literal) tuples when the server sends a {n}
+# literal, plain bytes otherwise
+
+SIMPLE_TEXT = [
+    b'1 (RFC822.SIZE 812 INTERNALDATE "05-Mar-2024 10:15:00 +0100" BODYSTRUCTURE '
+    b'("text" "plain" ("charset" "utf-8") NIL NIL "7bit" 120 4 NIL NIL NIL NIL))'
+]
+
+# Attachment name sent as a literal, disposition NIL on the body part
+LITERAL_NAME = [
+    (b'2 (RFC822.SIZE 40960 INTERNALDATE "06-Mar-2024 08:00:00 +0000" BODYSTRUCTURE '
+     b'(("text" "plain" ("charset" "us-ascii") NIL NIL "7bit" 10 1 NIL NIL NIL NIL)'
+     b'("application" "pdf" ("name" {14}', b'report (1).pdf'),
+    b') NIL NIL "base64" 7800 NIL ("attachment" ("filename" "report (1).pdf")) NIL NIL) '
+    b'"mixed" ("boundary" "b1") NIL NIL NIL))'
+]
+
+# A forwarded message/rfc822 part whose inner message carries the attachment
+FORWARDED = [
+    b'3 (RFC822.SIZE 20000 INTERNALDATE "07-Mar-2024 12:30:00 +0000" BODYSTRUCTURE '
+    b'(("text" "plain" ("charset" "utf-8") NIL NIL "7bit" 50 2 NIL NIL NIL NIL)'
+    b'("message" "rfc822" NIL NIL NIL "7bit" 15000 '
+    b'("Tue, 5 Mar 2024 09:00:00 +0000" "Inner" NIL NIL NIL NIL NIL NIL NIL "<inner@example.com>") '
+    b'(("text" "plain" ("charset" "utf-8") NIL NIL "7bit" 30 1 NIL NIL NIL NIL)'
+    b'("image" "png" ("name" "chart.png") NIL NIL "base64" 1560 NIL ("inline" NIL) NIL NIL) '
+    b'"mixed" ("boundary" "b3") NIL NIL NIL) 300 NIL NIL NIL NIL) '
+    b'"mixed" ("boundary" "b2") NIL NIL NIL))'
+]
+
+# Multipart extension data (parameters, disposition, language, location)
+# after the subtype, and a disposition-only filename
+EXTENSION_DATA = [
+    b'4 (RFC822.SIZE 5000 INTERNALDATE "08-Mar-2024 23:59:59 -0500" BODYSTRUCTURE '
+    b'(("text" "html" ("charset" "utf-8") NIL NIL "quoted-printable" 200 6 NIL NIL ("en") NIL)'
+    b'("text" "csv" NIL NIL NIL "7bit" 300 9 NIL ("attachment" ("filename" "data.csv")) NIL NIL) '
+    b'"mixed" ("boundary" "b4") ("inline" NIL) ("en" "de") "http://example.com/x"))'
+]
+
+
+def test_read_value_atoms_strings_and_lists():
+    assert read_value(b'NIL', 0) == (None, 3)
+    assert read_value(b'  "a \\"q\\" b" rest', 0) == ('a "q" b', 13)
+    assert read_value(b'("a" 12 NIL (x y))', 0)[0] == ['a', '12', None, ['x', 'y']]
+
+
+def test_read_value_literal():
+    value, pos = read_value(b'{5}\r\nhello world', 0)
+    assert value == 'hello'
+    assert pos == 10
+
+
+def test_simple_text_message():
+    metadata = parse_metadata_response(SIMPLE_TEXT)[1]
+    assert metadata['RFC822.SIZE'] == '812'
+    assert metadata['INTERNALDATE'] == '05-Mar-2024 10:15:00 +0100'
+    # A single part body is never saved as an attachment
+    assert attachment_parts(metadata['BODYSTRUCTURE']) == []
+
+
+def test_literal_filename():
+    metadata = parse_metadata_response(LITERAL_NAME)[2]
+    assert attachment_parts(metadata['BODYSTRUCTURE']) == [
+        # Same name parse_message would save it under
+        ('application/pdf', safe_filename('report (1).pdf'), int(7800 * 57 / 78))
+    ]
+
+
+def test_nested_message_rfc822():
+    metadata = parse_metadata_response(FORWARDED)[3]
+    assert attachment_parts(metadata['BODYSTRUCTURE']) == [
+        ('image/png', 'chart.png', int(1560 * 57 / 78))
+    ]
+
+
+def test_multipart_extension_data():
+    metadata = parse_metadata_response(EXTENSION_DATA)[4]
+    assert attachment_parts(metadata['BODYSTRUCTURE']) == [('text/csv', 'data.csv', 300)]
+
+
+def test_several_messages_in_one_response():
+    messages = parse_metadata_response(SIMPLE_TEXT + LITERAL_NAME + FORWARDED + EXTENSION_DATA)
+    assert sorted(messages) == [1, 2, 3, 4]
+
+
+class FlakyMail:
+    # Answers the first FETCH with a BAD, which imaplib raises as IMAP4.error
+    def __init__(self):
+        self.calls = 0
+
+    def fetch(self, message_set, query):
+        self.calls += 1
+        if self.calls == 1:
+            raise imaplib.IMAP4.error('FETCH command error: BAD [b"Too many messages"]')
+        return 'OK', SIMPLE_TEXT + LITERAL_NAME
+
+
+def test_fetch_metadata_retries_bad_response(monkeypatch):
+    monkeypatch.setattr(fetch_controller.time, 'sleep', lambda seconds: None)
+    mail = FlakyMail()
+    controller = AdaptiveFetchController(initial_batch=2)
+    results = dict(fetch_metadata(mail, [b'1', b'2', b'9'], controller))
+    assert mail.calls >= 2
+    assert controller.throttle_events == 1
+    assert results[b'1']['RFC822.SIZE'] == '812'
+    assert results[b'9'] == {}
+
+
+class HeaderMail:
+    # Answers the plan query with sizes, no structure and the row headers
+    def __init__(self, headers):
+        self.headers = headers
+
+    def fetch(self, message_set, query):
+        data = []
+        for num in message_set.split(','):
+            header = self.headers[int(num) - 1]
+            head = f'{num} (RFC822.SIZE 100 INTERNALDATE "05-Mar-2024 10:15:00 +0100" BODYSTRUCTURE NIL '
+            if 'HEADER.FIELDS' in query:
+                data.append(((head + f'BODY[HEADER.FIELDS (SUBJECT FROM DATE)] {{{len(header)}}}').encode(), header))
+                data.append(b')')
+            else:
+                data.append((head + ')').encode())
+        return 'OK', data
+
+
+class FakeSource:
+    def __init__(self, mail, seen_index):
+        self.mail = mail
+        self.seen_index = seen_index
+
+    def search(self, emit):
+        return [b'1', b'2']
+
+
+def test_read_value_section_name():
+    value, _ = read_value(b'(BODY[HEADER.FIELDS (SUBJECT FROM)] {3}\r\nabc)', 0)
+    assert value == ['BODY[HEADER.FIELDS (SUBJECT FROM)]', 'abc']
+
+
+def test_plan_skips_rows_already_in_an_old_report(tmp_path):
+    report = tmp_path / 'report.jsonl'
+    report.write_text(json.dumps({'Subject': 'Receipt', 'Sender': 'Shop <s@example.com>',
+                                  'Date': 'Tue, 5 Mar 2024 10:00:00 +0000'}) + '\n')
+    seen_index = SeenIndex(str(tmp_path / 'seen.idx'))
+    seen_index.seed_from_report(str(report), 'jsonl')
+    mail = HeaderMail([
+        b'Subject: Receipt\r\nFrom: Shop <s@example.com>\r\nDate: Tue, 5 Mar 2024 10:00:00 +0000\r\n\r\n',
+        b'Subject: Receipt\r\nFrom: Shop <s@example.com>\r\nDate: Wed, 6 Mar 2024 10:00:00 +0000\r\n\r\n'
+    ])
+    plan = plan_run(FakeSource(mail, seen_index))
+    assert plan.already_reported == 1
+    assert plan.total('messages') == 1
@@ -0,0 +1,41 @@
+import sqlite3
+from records import EmailRecord
+from search_index import SearchIndex
+
+
+def receipt(message_id='', content_hash='same-body'):
+    return EmailRecord(subject='Your Grab E-Receipt', sender='Grab <g@grab.com>', date='Tue, 25 Mar 2025',
+                       content='Total Rp 10.000', message_id=message_id, content_hash=content_hash)
+
+
+def test_identical_bodies_are_indexed_separately(tmp_path):
+    with SearchIndex(str(tmp_path / 'index.sqlite')) as index:
+        assert index.add(receipt('a@grab.com'), raw_email=b'Message-ID: <a@grab.com>\r\n\r\nbody')
+        assert index.add(receipt('b@grab.com'), raw_email=b'Message-ID: <b@grab.com>\r\n\r\nbody')
+        assert not index.add(receipt('<a@grab.com>'), raw_email=b'Received: x\r\nMessage-ID: <a@grab.com>\r\n\r\nbody')
+        # Without a Message-ID the whole message tells them apart
+        assert index.add(receipt(), raw_email=b'Date: Mon\r\n\r\nbody')
+        assert index.add(receipt(), raw_email=b'Date: Tue\r\n\r\nbody')
+        assert not index.add(receipt(), raw_email=b'Date: Tue\r\n\r\nbody')
+        assert index.count() == 4
+        assert len(index.query('grab')) == 4
+
+
+def test_old_index_is_rekeyed(tmp_path):
+    path = str(tmp_path / 'index.sqlite')
+    connection = sqlite3.connect(path)
+    connection.executescript('''
+        CREATE TABLE messages (id INTEGER PRIMARY KEY, content_hash TEXT UNIQUE NOT NULL);
+        CREATE VIRTUAL TABLE email_fts USING fts5(subject, sender, content, attachments, date UNINDEXED,
+                                                   message_id UNINDEXED);
+        INSERT INTO messages VALUES (1, 'hash-a'), (2, 'hash-b');
+        INSERT INTO email_fts (rowid, subject, message_id) VALUES (1, 'a', 'a@grab.com'), (2, 'b', '');
+    ''')
+    connection.commit()
+    connection.close()
+
+    with SearchIndex(path) as index:
+        keys = dict(index.connection.execute('SELECT id, key FROM messages'))
+        assert keys == {1: 'mid:a@grab.com', 2: 'body:hash-b'}
+        assert not index.add(receipt('a@grab.com', 'other-body'), raw_email=b'x')
+        assert index.count() == 2
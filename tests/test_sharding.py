@@ -0,0 +1,89 @@
+import datetime
+import re
+from sharding import Shard, ShardCheckpoints, month_windows, plan_shards, run_shards, search_key
+
+
+class DatedMail:
+    # SEARCH over a fixed list of message dates, honouring SINCE/BEFORE
+    def __init__(self, dates):
+        self.dates = dates
+        self.searches = []
+
+    def search(self, charset, criteria):
+        self.searches.append(criteria)
+        since = re.search(r'SINCE "([^"]+)"', criteria)
+        before = re.search(r'BEFORE "([^"]+)"', criteria)
+        since = datetime.datetime.strptime(since.group(1), '%d-%b-%Y') if since else datetime.datetime.min
+        before = datetime.datetime.strptime(before.group(1), '%d-%b-%Y') if before else datetime.datetime.max
+        nums = [str(i + 1) for i, date in enumerate(self.dates) if since <= date < before]
+        return 'OK', [' '.join(nums).encode()]
+
+
+def day(month, day_of_month):
+    return datetime.datetime(2024, month, day_of_month)
+
+
+def test_month_windows_split_at_month_boundaries():
+    assert month_windows(day(1, 15), day(3, 10)) == [
+        (day(1, 15), day(2, 1)), (day(2, 1), day(3, 1)), (day(3, 1), day(3, 10))
+    ]
+    assert month_windows(datetime.datetime(2024, 12, 20), datetime.datetime(2025, 1, 5)) == [
+        (datetime.datetime(2024, 12, 20), datetime.datetime(2025, 1, 1)),
+        (datetime.datetime(2025, 1, 1), datetime.datetime(2025, 1, 5))
+    ]
+    assert month_windows(day(3, 1), day(3, 1)) == []
+
+
+def test_plan_shards_halves_busy_windows():
+    # 40 emails on the 1st to 8th of January, 3 in February, none in March
+    dates = [day(1, 1 + i % 8) for i in range(40)] + [day(2, 10)] * 3
+    shards = plan_shards(DatedMail(dates), None, day(1, 1), day(4, 1), target_size=10)
+    assert sum(shard.count for shard in shards) == 43
+    assert all(shard.count <= 10 or (shard.end - shard.start).days == 1 for shard in shards)
+    assert shards[-1].key == Shard(day(2, 1), day(3, 1)).key
+    # Shards come back in date order without gaps between non-empty ones
+    assert [shard.start for shard in shards] == sorted(shard.start for shard in shards)
+
+
+def test_empty_windows_are_not_checkpointed(tmp_path):
+    checkpoints = ShardCheckpoints(str(tmp_path), 'key')
+    mail = DatedMail([day(2, 10)])
+    plan_shards(mail, None, day(1, 1), day(3, 1), checkpoints=checkpoints)
+    assert not checkpoints.is_done(Shard(day(1, 1), day(2, 1)))
+    # A message that shows up in January later is still found
+    mail.dates.append(day(1, 5))
+    shards = plan_shards(mail, None, day(1, 1), day(3, 1), checkpoints=checkpoints)
+    assert [shard.count for shard in shards] == [1, 1]
+
+
+def test_run_shards_checkpoints_only_clean_shards(tmp_path):
+    checkpoints = ShardCheckpoints(str(tmp_path), 'key')
+    clean = Shard(day(1, 1), day(2, 1), 2)
+    failed_email = Shard(day(2, 1), day(3, 1), 2)
+    errored = Shard(day(3, 1), day(4, 1), 2)
+    future = Shard(day(4, 1), datetime.datetime.now() + datetime.timedelta(days=2), 2)
+    results = {
+        clean.key: (['a', 'b'], {}),
+        failed_email.key: (['c'], {'emails_failed': 1}),
+        errored.key: ([], {'error': 'connection reset'}),
+        future.key: (['d'], {})
+    }
+    messages = []
+    emails = run_shards([clean, failed_email, errored, future], lambda shard, emit: results[shard.key],
+                        workers=2, checkpoints=checkpoints, status_callback=messages.append)
+    assert emails == ['a', 'b', 'c', 'd']
+    assert [checkpoints.is_done(shard) for shard in (clean, failed_email, errored, future)] == [
+        True, False, False, False
+    ]
+    assert any('retried' in message for message in messages)
+
+
+def test_checkpoints_are_per_account_and_mailbox():
+    keys = {
+        search_key('Receipt', True, 'a@example.com'),
+        search_key('Receipt', True, 'b@example.com'),
+        search_key('Receipt', True, 'a@example.com', '[Gmail]/All Mail'),
+        search_key('Receipt', False, 'a@example.com')
+    }
+    assert len(keys) == 4
+    assert search_key('Receipt', True, 'A@Example.com ') == search_key('Receipt', True, 'a@example.com')